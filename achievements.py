@@ -0,0 +1,138 @@
+"""Event-driven stats and achievement tracking for SmartBot Pro.
+
+Stats are updated in memory as events happen (a chat message, a quiz
+result, a new personality) and only the achievements that event can
+affect are re-evaluated. The caller flushes the stats once per turn.
+"""
+from datetime import datetime
+
+ACHIEVEMENTS = {
+    "first_chat": {"name": "🎉 First Steps", "desc": "Had your first conversation", "points": 10},
+    "chat_5": {"name": "💬 Chatty", "desc": "Had 5 conversations", "points": 25},
+    "chat_25": {"name": "🗣️ Conversationalist", "desc": "Had 25 conversations", "points": 50},
+    "chat_100": {"name": "🏆 Chat Master", "desc": "Had 100 conversations", "points": 100},
+    "streak_3": {"name": "🔥 On Fire", "desc": "3-day streak", "points": 30},
+    "streak_7": {"name": "🌟 Dedicated", "desc": "7-day streak", "points": 75},
+    "quiz_master": {"name": "🧠 Quiz Master", "desc": "Scored 5 perfect quizzes", "points": 50},
+    "night_owl": {"name": "🦉 Night Owl", "desc": "Chatted past midnight", "points": 15},
+    "early_bird": {"name": "🌅 Early Bird", "desc": "Chatted before 6 AM", "points": 15},
+    "topic_explorer": {"name": "🌍 Explorer", "desc": "Discussed 10+ different topics", "points": 40},
+    "long_conversation": {"name": "📖 Deep Thinker", "desc": "Had a 20+ message conversation", "points": 35},
+    "personality_switcher": {"name": "🎭 Shapeshifter", "desc": "Tried all AI personalities", "points": 60}
+}
+
+DEFAULT_STATS = {
+    "total_messages": 0,
+    "quiz_score": 0,
+    "quiz_attempts": 0,
+    "topics": [],
+    "last_chat_date": None,
+    "streak_days": 0,
+    "personalities_used": [],
+    "total_points": 0,
+    "level": 1,
+    "unlocked_achievements": []
+}
+
+# Achievements each event can unlock; nothing else is re-checked
+EVENT_ACHIEVEMENTS = {
+    "message": ["first_chat", "chat_5", "chat_25", "chat_100", "long_conversation",
+                "streak_3", "streak_7", "night_owl", "early_bird"],
+    "topic": ["topic_explorer"],
+    "personality": ["personality_switcher"],
+    "quiz": ["quiz_master"]
+}
+
+
+class AchievementEngine:
+    def __init__(self, stats, personality_count):
+        self.stats = stats
+        self.personality_count = personality_count
+        self.unlocked = set(stats["unlocked_achievements"])
+        self.newly_unlocked = []
+        self.dirty = False
+
+    def _condition(self, ach_id, now):
+        stats = self.stats
+        if ach_id == "first_chat":
+            return stats["total_messages"] >= 1
+        if ach_id == "chat_5":
+            return stats["total_messages"] >= 5
+        if ach_id == "chat_25":
+            return stats["total_messages"] >= 25
+        if ach_id == "chat_100":
+            return stats["total_messages"] >= 100
+        if ach_id == "long_conversation":
+            return stats["total_messages"] >= 20
+        if ach_id == "streak_3":
+            return stats["streak_days"] >= 3
+        if ach_id == "streak_7":
+            return stats["streak_days"] >= 7
+        if ach_id == "early_bird":
+            return 0 <= now.hour < 6
+        if ach_id == "night_owl":
+            return now.hour >= 23 or now.hour < 2
+        if ach_id == "topic_explorer":
+            return len(stats["topics"]) >= 10
+        if ach_id == "personality_switcher":
+            return len(stats["personalities_used"]) >= self.personality_count
+        if ach_id == "quiz_master":
+            return stats.get("quiz_score", 0) >= 5
+        return False
+
+    def _check(self, event, now):
+        for ach_id in EVENT_ACHIEVEMENTS[event]:
+            if ach_id not in self.unlocked and self._condition(ach_id, now):
+                self.unlocked.add(ach_id)
+                self.stats["unlocked_achievements"].append(ach_id)
+                self.stats["total_points"] += ACHIEVEMENTS[ach_id]["points"]
+                self.newly_unlocked.append(ACHIEVEMENTS[ach_id]["name"])
+        # Every 100 points = 1 level
+        self.stats["level"] = 1 + (self.stats["total_points"] // 100)
+
+    # ---------------- EVENTS ----------------
+    def record_message(self, topic=None, personality=None, now=None):
+        now = now or datetime.now()
+        stats = self.stats
+        stats["total_messages"] += 1
+
+        today = now.date()
+        if stats["last_chat_date"]:
+            last_date = datetime.fromisoformat(stats["last_chat_date"]).date()
+            if (today - last_date).days == 1:
+                stats["streak_days"] += 1
+            elif (today - last_date).days > 1:
+                stats["streak_days"] = 1
+        else:
+            stats["streak_days"] = 1
+        stats["last_chat_date"] = now.isoformat()
+
+        self.dirty = True
+        self._check("message", now)
+        if topic and topic not in stats["topics"]:
+            stats["topics"].append(topic)
+            self._check("topic", now)
+        if personality:
+            self.record_personality(personality, now)
+
+    def record_personality(self, personality, now=None):
+        if personality in self.stats["personalities_used"]:
+            return
+        self.stats["personalities_used"].append(personality)
+        self.dirty = True
+        self._check("personality", now or datetime.now())
+
+    def record_quiz(self, correct, now=None):
+        self.stats["quiz_attempts"] = self.stats.get("quiz_attempts", 0) + 1
+        if correct:
+            self.stats["quiz_score"] = self.stats.get("quiz_score", 0) + 1
+        self.dirty = True
+        self._check("quiz", now or datetime.now())
+
+    def flush(self, save_stats):
+        """Persist the stats once if anything changed; returns new unlock names"""
+        if self.dirty:
+            save_stats(self.stats)
+            self.dirty = False
+        unlocked, self.newly_unlocked = self.newly_unlocked, []
+        return unlocked
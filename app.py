@@ -1,18 +1,22 @@
 import streamlit as st 
-from google import genai
-from google.genai import types 
 from dotenv import load_dotenv 
 import os
 
+import llm
+import memory
+import metrics
+
 st.title("ChatGPT-like clone")
 
 # Set OpenAI API key from Streamlit secrets
-client = genai.Client(api_key=st.secrets["GEMINI_API_KEY"])
+client = llm.get_client(st.secrets["GEMINI_API_KEY"])
 
 
 # Initialize chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
 
 #Display chat messages from history on app rerun
 for message in st.session_state.messages:
@@ -28,12 +32,20 @@ if prompt := st.chat_input("What is up?"):
         st.markdown(prompt)
 
 #Display assistant response in chat message container
-    
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite",
-            contents= [prompt]
-           )
+    try:
         with st.chat_message("assistant"):
-            st.markdown(response.text)  #Added response.text as only response is metadata, not just a string
-       
-    st.session_state.messages.append({"role": "assistant", "content": response.text})
\ No newline at end of file
+            # Stream the reply as it is generated instead of waiting for the full text
+            context = st.session_state.memory.messages()
+            reply = st.write_stream(llm.stream_text(
+                client, "gemini-2.5-flash-lite", llm.chat_contents(context, prompt)
+            ))
+
+        st.session_state.messages.append({"role": "assistant", "content": reply})
+        st.session_state.memory.record_turn(
+            prompt, reply, llm.summarizer(client, "gemini-2.5-flash-lite")
+        )
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
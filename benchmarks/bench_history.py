@@ -0,0 +1,82 @@
+"""History-size scaling of the bots' storage paths, no model calls involved.
+
+Each operation is the body of the bot function it is named after, run
+against the shared modules the bots use:
+
+- parse:                      cold load of the history file
+- save_interaction:           append one chat turn (counterbot/timebot/mybot)
+- get_due_question:           build the due queue, then find the next card (spacedrep)
+- check_achievements:         record a message and flush stats (mybot)
+- build_messages_for_gemini:  the Socratic tutor's history seed
+
+Run from the repository root:
+
+    python benchmarks/bench_history.py [sizes, e.g. 10,1000,10000,100000]
+"""
+import sys
+from datetime import datetime
+
+from common import measure, parse_sizes, print_header, print_row, seed_history, temp_workdir
+
+import achievements
+import scheduler
+import storage
+
+DATA_FILE = "chat_history.json"
+STATS_FILE = "user_stats.json"
+REPEAT = 50
+
+
+def build_messages_for_gemini():
+    interactions = storage.load_data(DATA_FILE)["interactions"]
+    recent = [item for item in interactions if "role" in item][-20:]
+    return [
+        {"role": "user" if item["role"] == "user" else "model", "parts": [item["content"]]}
+        for item in recent
+    ]
+
+
+def bench(size):
+    with temp_workdir():
+        seed_history(DATA_FILE, size)
+
+        def parse():
+            storage._cache.clear()
+            storage.load_data(DATA_FILE)
+
+        print_row(size, "parse (cold)", *measure(parse, repeat=3))
+
+        def save_interaction():
+            storage.append_interaction(DATA_FILE, {
+                "query": "How do plants make food?",
+                "response": "answer " * 100,
+                "time": datetime.now().isoformat()
+            })
+
+        print_row(size, "save_interaction", *measure(save_interaction, REPEAT))
+
+        queue = scheduler.DueQueue(scheduler.get_scheduler())
+        print_row(size, "get_due_question (build)", *measure(
+            lambda: queue.load(storage.load_data(DATA_FILE)["interactions"]), repeat=3
+        ))
+        print_row(size, "get_due_question", *measure(queue.next_due, REPEAT))
+
+        def check_achievements():
+            engine = achievements.AchievementEngine(
+                storage.load_json(STATS_FILE, achievements.DEFAULT_STATS), 4
+            )
+            engine.record_message("Science", "Friendly")
+            engine.flush(lambda stats: storage.save_json(STATS_FILE, stats))
+
+        print_row(size, "check_achievements", *measure(check_achievements, REPEAT))
+        print_row(size, "build_messages_for_gemini", *measure(build_messages_for_gemini, REPEAT))
+
+
+def main(sizes):
+    print_header(f"Storage paths ({storage.BACKEND} backend)")
+    for size in sizes:
+        bench(size)
+
+
+if __name__ == "__main__":
+    main(parse_sizes(sys.argv))
@@ -0,0 +1,65 @@
+"""Full-text search over the history: index build, incremental add and query latency.
+
+The second table goes through ``storage`` on each backend, as the history
+sidebar does: a warm search or page must stay in milliseconds even though
+every call first checks the file for new records.
+
+Run from the repository root:
+
+    python benchmarks/bench_search.py [sizes, e.g. 10,1000,10000,100000]
+"""
+import os
+import sys
+
+from common import make_history, measure, parse_sizes, print_header, print_row, seed_history, temp_workdir
+
+import search
+import storage
+
+REPEAT = 50
+QUERIES = ["answer", "question about math", "socratic text", "philos"]
+
+
+def main(sizes):
+    print_header("Full-text search")
+    for count in sizes:
+        items = make_history(count)
+        index = search.SearchIndex()
+        print_row(count, "build index", *measure(lambda: index.sync(items)))
+        print_row(count, "add one turn", *measure(
+            lambda: index.add({"id": "new", "query": "fresh question", "response": "more text"}), REPEAT
+        ))
+        for query in QUERIES:
+            print_row(count, f"search {query!r}", *measure(lambda: index.search(query, 20), REPEAT))
+        print_row(count, "search 'answer', queries only", *measure(
+            lambda: index.search("answer", 20, field="query"), REPEAT
+        ))
+    for backend in ["json", "sqlite"]:
+        backend_rows(backend, sizes)
+
+
+def backend_rows(backend, sizes):
+    print_header(f"History search and paging ({backend} storage)")
+    previous, storage.BACKEND = storage.BACKEND, backend
+    try:
+        for count in sizes:
+            with temp_workdir() as directory:
+                # Absolute, so each size gets its own SQLite connection
+                path = os.path.join(directory, "chat_history.json")
+                seed_history(path, count)
+                search._indexes.clear()
+                print_row(count, "first search (builds index)", *measure(
+                    lambda: search.search(path, "answer", 20)
+                ))
+                print_row(count, "warm search", *measure(lambda: search.search(path, "answer", 20), REPEAT))
+                print_row(count, "first page", *measure(
+                    lambda: storage.page_interactions(path, None, 20, "query"), REPEAT
+                ))
+                storage.append_interaction(path, {"query": "fresh question"})
+                print_row(count, "search after one append", *measure(lambda: search.search(path, "fresh", 20)))
+    finally:
+        storage.BACKEND = previous
+
+
+if __name__ == "__main__":
+    main(parse_sizes(sys.argv))
@@ -0,0 +1,62 @@
+"""Topic classifier throughput: old substring scan vs the compiled regex.
+
+Run from the repository root:
+
+    python benchmarks/bench_topics.py [number_of_messages]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import topics
+
+WORDS = (
+    "explain how the start of this story relates to what we learned about plants "
+    "and please help me understand the code for my computer project with some math "
+    "equation about ancient history and the meaning of music in painting today"
+).split()
+
+
+def substring_classify(text):
+    """The previous mybot implementation, kept for comparison"""
+    keyword_table = dict(topics.TOPIC_KEYWORDS, General=[])
+    text_lower = text.lower()
+    for topic, keywords in keyword_table.items():
+        if any(keyword in text_lower for keyword in keywords):
+            return topic
+    return "General"
+
+
+def make_messages(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(5, 40))) for _ in range(count)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main(count):
+    messages = make_messages(count)
+
+    old, _ = timed(lambda: [substring_classify(m) for m in messages])
+    per_call, _ = timed(lambda: [topics.classify(m) for m in messages])
+    bulk, tags = timed(topics.classify_many, messages)
+    assert tags == [topics.classify(m) for m in messages]
+
+    print(f"{count} messages")
+    for label, seconds in [
+        ("substring scan (old)", old),
+        ("classify() per call", per_call),
+        ("classify_many() 1 pass", bulk)
+    ]:
+        print(f"  {label:<22} {seconds * 1000:9.1f} ms  {count / seconds:12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,96 @@
+"""Per-turn latency of each bot, driven headlessly with Streamlit's AppTest.
+
+The Gemini clients are swapped for the local stand-ins in ``fake_genai``,
+so no network or API key is needed and the model's share of each turn is
+fixed by ``--latency`` and ``--tokens``. Everything else (storage, caches,
+memory, quiz pools) runs for real against a seeded history.
+
+Run from the repository root:
+
+    python benchmarks/bench_turns.py --sizes 10,1000 --turns 5 --latency 0.2
+"""
+import argparse
+import os
+
+from common import ROOT, SIZES, measure, print_header, print_row, seed_history, temp_workdir
+from fake_genai import FakeClient, FakeGenerativeModel
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import llm
+import question_bank
+import resilience
+import response_cache
+import retrieval
+import scheduler
+import search
+import storage
+
+BOTS = ["app.py", "counterbot.py", "timebot.py", "spacedrep.py", "mybot.py", "socratic.py"]
+
+
+def install_fakes(options):
+    """
+    Point the shared client factories at the stand-ins; the bots import them
+    from ``llm``. The rate limiter is opened up so turns measure the bots,
+    not the pacing to ``GEMINI_RPM``.
+    """
+    client = FakeClient(**options)
+    models = {}
+
+    def get_generative_model(api_key, model_name, system_instruction=None):
+        return models.setdefault((model_name, system_instruction), FakeGenerativeModel(**options))
+
+    llm.get_client = lambda api_key: client
+    llm.get_generative_model = get_generative_model
+    resilience.limiter = resilience.TokenBucket(1e9, 1e9)
+    return client
+
+
+def reset_process_state():
+    """
+    Drop per-process caches keyed on relative paths, which every run reuses,
+    so each bot's first load starts cold; and reset the breaker state.
+    """
+    st.cache_resource.clear()
+    for cache in [retrieval._indexes, search._indexes, question_bank._banks, scheduler._queues,
+                  storage._cache, storage._documents]:
+        cache.clear()
+    response_cache._cache = None
+    resilience.breaker = resilience.CircuitBreaker()
+
+
+def bench(bot, size, turns):
+    reset_process_state()
+    with temp_workdir():
+        seed_history("chat_history.json", size)
+        app = AppTest.from_file(os.path.join(ROOT, bot), default_timeout=120)
+        app.secrets["GEMINI_API_KEY"] = "offline"
+        timings, _ = measure(app.run)
+        print_row(size, f"{bot} first load", timings)
+
+        prompts = iter(f"Tell me about topic number {n}" for n in range(turns))
+        timings, written = measure(lambda: app.chat_input[0].set_value(next(prompts)).run(), turns)
+        if app.exception:
+            print(f"          {bot} raised: {app.exception[0].message}")
+        print_row(size, f"{bot} chat turn", timings, written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--bots", default=",".join(BOTS))
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to first token")
+    parser.add_argument("--tokens", type=int, default=150, help="tokens per reply")
+    args = parser.parse_args()
+
+    install_fakes({"latency": args.latency, "tokens": args.tokens})
+    print_header(f"Chat turns (fake model: {args.latency}s to first token, {args.tokens} tokens)")
+    for size in map(int, args.sizes.split(",")):
+        for bot in args.bots.split(","):
+            bench(bot, size, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Shared helpers for the benchmarks: synthetic histories, timing and I/O counters."""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage
+
+SIZES = [10, 1_000, 10_000, 100_000]
+TOPICS = ["Science", "Technology", "Math", "History", "Art", "Philosophy", "General"]
+
+
+def make_history(count, seed=0):
+    """Records shaped like the bots write them, about one in five from the tutor"""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=30)
+    items = []
+    for n in range(count):
+        when = (start + timedelta(minutes=n)).isoformat()
+        if rng.random() < 0.2:
+            items.append({
+                "id": storage.new_id(),
+                "role": rng.choice(["user", "assistant"]),
+                "content": f"Socratic message {n} " + "text " * rng.randint(5, 40),
+                "time": when
+            })
+        else:
+            items.append({
+                "id": storage.new_id(),
+                "query": f"Question {n} about {rng.choice(TOPICS).lower()}",
+                "response": "answer " * rng.randint(20, 200),
+                "topic": rng.choice(TOPICS),
+                "level": rng.randint(0, 3),
+                "last_reviewed": when,
+                "time": when
+            })
+    return items
+
+
+@contextmanager
+def temp_workdir():
+    """Run inside a fresh directory so history files and caches start empty"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(previous)
+
+
+def seed_history(path, count):
+    storage.save_data(path, {"interactions": make_history(count)})
+    storage._cache.clear()
+
+
+def bytes_written():
+    """Bytes this process has passed to write() so far (Linux), else None"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def measure(fn, repeat=1):
+    """(per-call seconds list, bytes written per call or None)"""
+    before = bytes_written()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    after = bytes_written()
+    written = None if before is None else (after - before) / repeat
+    return timings, written
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+    }
+
+
+def print_row(size, name, timings, written=None):
+    stats = summarize(timings)
+    written = "-" if written is None else f"{written / 1024:,.1f} KiB"
+    print(
+        f"{size:>8,}  {name:<28} {stats['median_ms']:10.2f} ms {stats['p95_ms']:10.2f} ms  {written:>12}"
+    )
+
+
+def print_header(title):
+    print(f"\n{title}")
+    print(f"{'history':>8}  {'operation':<28} {'median':>13} {'p95':>13}  {'written':>12}")
+
+
+def parse_sizes(argv):
+    if len(argv) > 1:
+        return [int(size) for size in argv[1].split(",")]
+    return SIZES
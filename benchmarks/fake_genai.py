@@ -0,0 +1,101 @@
+"""Local stand-in for the Gemini clients, for offline benchmarks.
+
+``FakeClient`` mimics the parts of ``google.genai.Client`` the bots use
+(``models.generate_content``, ``models.generate_content_stream`` and
+``aio.models.generate_content``); ``FakeGenerativeModel`` mimics the
+``google.generativeai`` model and chat session used by the Socratic tutor.
+Replies are filler text of a fixed token count, delivered after a
+configurable first-token latency and per-token delay.
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+WORD = "lorem "  # ~1 token
+
+
+class FakeModel:
+    def __init__(self, latency=0.3, tokens=150, tokens_per_second=400, chunk_tokens=20):
+        self.latency = latency
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.calls = 0
+
+    def _usage(self, contents):
+        prompt_tokens = len(json.dumps(contents, default=str)) // 4
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=self.tokens,
+            total_token_count=prompt_tokens + self.tokens
+        )
+
+    def _reply(self, config):
+        if getattr(config, "response_mime_type", None) == "application/json":
+            properties = getattr(config.response_schema, "properties", None) or {}
+            if "verdict" in properties:
+                return json.dumps({"verdict": "correct", "score": 1, "feedback": WORD * self.tokens})
+            return "[]"
+        return "Correct: " + WORD * self.tokens
+
+    def _response(self, text, contents):
+        return SimpleNamespace(text=text, usage_metadata=self._usage(contents))
+
+    def _generation_time(self):
+        return self.latency + self.tokens / self.tokens_per_second
+
+    def generate_content(self, model=None, contents=None, config=None):
+        self.calls += 1
+        time.sleep(self._generation_time())
+        return self._response(self._reply(config), contents)
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = self._reply(config)
+        step = len(WORD) * self.chunk_tokens
+        for start in range(0, len(text), step):
+            time.sleep(self.chunk_tokens / self.tokens_per_second)
+            yield self._response(text[start:start + step], contents)
+
+
+class FakeAsyncModels:
+    def __init__(self, model):
+        self.model = model
+
+    async def generate_content(self, model=None, contents=None, config=None):
+        self.model.calls += 1
+        await asyncio.sleep(self.model._generation_time())
+        return self.model._response(self.model._reply(config), contents)
+
+
+class FakeClient:
+    def __init__(self, **options):
+        self.models = FakeModel(**options)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(self.models))
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, message, stream=False, **kwargs):
+        self.history.append({"role": "user", "parts": [message]})
+        chunks = list(self.model.generate_content_stream(contents=message))
+        self.history.append({"role": "model", "parts": ["".join(c.text for c in chunks)]})
+        return iter(chunks) if stream else chunks[-1]
+
+
+class FakeGenerativeModel:
+    """Stand-in for ``google.generativeai.GenerativeModel``"""
+
+    def __init__(self, **options):
+        self.model = FakeModel(**options)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self.model, history or [])
+
+    def generate_content(self, contents):
+        return self.model.generate_content(contents=contents)
@@ -1,54 +1,89 @@
 import streamlit as st
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-import random
-import json
+import functools
 import os
 from datetime import datetime
 
+import grading
+import history_browser
+import llm
+import memory
+import metrics
+import question_bank
+import quiz_pool
+import retrieval
+import storage
+import users
+
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="CounterBot", layout="centered")
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = llm.get_client(os.getenv("GEMINI_API_KEY"))
 
 MODEL_NAME = "gemini-2.5-flash-lite"
-DATA_FILE = "chat_history.json"
+DATA_FILE = storage.user_path("chat_history.json", users.current_user_id())
+BANK_FILE = storage.user_path("question_bank.json", users.current_user_id())
 
 # ---------------- JSON HELPERS ----------------
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"interactions": []}
-
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        # File exists but is empty or corrupted
-        return {"interactions": []}
-
+    return storage.load_data(DATA_FILE)
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    storage.save_data(DATA_FILE, data)
 
 def save_interaction(query, response):
-    data = load_data()
-    data["interactions"].append({
+    storage.append_interaction(DATA_FILE, {
         "query": query,
         "response": response,
         "time": datetime.now().isoformat()
     })
-    save_data(data)
-#----------QUIZ JSON FUNCTION--------
-def get_random_query_from_history():
-    data = load_data()
-    interactions = data.get("interactions", [])
 
-    if not interactions:
-        return None
+def format_history_item(item, shorten):
+    return (
+        f"**Q:** {shorten(item['query'])}\n\n"
+        f"**A:** {shorten(item['response'])}\n\n"
+        f"⏱ {item.get('time', '')}\n---"
+    )
+
+# ---------------- QUIZ PRE-GENERATION ----------------
+def build_quiz_prompt(topic):
+    return (
+        "Create a short conceptual quiz question based on the following topic. "
+        "Do NOT give the answer.\n\n"
+        f"Topic: {topic}"
+    )
+
+def generate_quiz_question(topic, existing=()):
+    # A variant must differ from the banked ones, so only a first question is cached
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return llm.generate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
 
-    return random.choice(interactions)["query"]
+def quiz_question(source_id, topic):
+    """A banked question for this source, generated only when its bank runs dry"""
+    return question_bank.get_bank(BANK_FILE).question_for(source_id, topic, generate_quiz_question)
+
+def pick_quiz_source(data_file, exclude):
+    """A past query unlike the ones already buffered"""
+    return retrieval.sample_source(data_file, exclude)
+
+@st.cache_resource(max_entries=users.MAX_ACTIVE_USERS)
+def get_quiz_pool(data_file):
+    """Quiz questions generated ahead of time on worker threads, per history file"""
+    return quiz_pool.QuizPool(functools.partial(pick_quiz_source, data_file), quiz_question)
+
+def next_quiz():
+    """Return (topic, question), using a pre-generated question when one is ready"""
+    pool = get_quiz_pool(DATA_FILE)
+    ready = pool.pop()
+    pool.refill()
+    if ready:
+        return ready[1], ready[2]
+    source = retrieval.sample_source(DATA_FILE)
+    if source is None:
+        return None
+    return source[1], quiz_question(*source)
 
 # ---------------- UI ----------------
 st.title("Counterbot 🤖")
@@ -57,6 +92,9 @@ st.caption("Quizzes you every 5 interactions!")
 if "chat" not in st.session_state:
     st.session_state.chat = []
 
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
+
 if "quiz_question" not in st.session_state:
     st.session_state.quiz_question = None
 
@@ -76,29 +114,14 @@ if user_input:
     st.session_state.counter += 1
     if st.session_state.counter == 5:
         st.session_state.counter = 0
-        quiz_source = get_random_query_from_history()
-
-        if quiz_source is None:
-            st.sidebar.warning("No chat history available to generate a quiz.")
-        else:
-            quiz_prompt = (
-                "Create a short conceptual quiz question based on the following topic. "
-                "Do NOT give the answer.\n\n"
-                f"Topic: {quiz_source}"
-            )
-
-            quiz_response = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[types.Part(text=quiz_prompt)]
-                    )
-                ]
-            )
-
-            st.session_state.quiz_topic = quiz_source
-            st.session_state.quiz_question = quiz_response.text
+        try:
+            quiz = next_quiz()
+            if quiz is None:
+                st.sidebar.warning("No chat history available to generate a quiz.")
+            else:
+                st.session_state.quiz_topic, st.session_state.quiz_question = quiz
+        except Exception as e:
+            st.sidebar.error(f"Error generating quiz: {e}")
         if st.session_state.quiz_question:
             st.sidebar.markdown("### 🧠 Quiz Question")
             st.sidebar.markdown(st.session_state.quiz_question)
@@ -109,28 +132,17 @@ if user_input:
             )
 
             if st.sidebar.button("Submit answer"):
-                evaluation_prompt = (
-                    "You are an examiner.\n\n"
-                    f"Topic: {st.session_state.quiz_topic}\n\n"
-                    f"Question: {st.session_state.quiz_question}\n\n"
-                    f"Student Answer: {user_answer}\n\n"
-                    "Decide whether the answer is correct or incorrect. "
-                    "Start your response with either 'Correct:' or 'Incorrect:' "
-                    "and then give a brief explanation."
-                )
-
-                evaluation_response = client.models.generate_content(
-                    model=MODEL_NAME,
-                    contents=[
-                        types.Content(
-                            role="user",
-                            parts=[types.Part(text=evaluation_prompt)]
-                        )
-                    ]
-                )
-
-                st.sidebar.markdown("### Evaluation")
-                st.sidebar.markdown(evaluation_response.text)
+                try:
+                    grade = grading.grade_answer(
+                        client, MODEL_NAME, st.session_state.quiz_topic, st.session_state.quiz_question, user_answer
+                    )
+                    st.sidebar.markdown("### Evaluation")
+                    st.sidebar.markdown(grading.format_grade(grade))
+                    question_bank.get_bank(BANK_FILE).record_answer(
+                        st.session_state.quiz_question, user_answer, grade
+                    )
+                except Exception as e:
+                    st.sidebar.error(f"Evaluation error: {e}")
 
 
 if user_input:
@@ -140,66 +152,44 @@ if user_input:
         st.markdown(user_input)
 
 
-    # Gemini response
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            types.Content(
-                role="user",
-                parts=[types.Part(text=user_input)]
+    try:
+        # Gemini response, streamed as it is generated
+        context = st.session_state.memory.messages()
+        with st.chat_message("assistant"):
+            reply = st.write_stream(
+                llm.stream_text(client, MODEL_NAME, llm.chat_contents(context, user_input))
             )
-        ]
-    )
-
-    reply = response.text
 
-    # Assistant message
-    st.session_state.chat.append({"role": "assistant", "content": reply})
-    with st.chat_message("assistant"):
-        st.markdown(reply)
+        # Assistant message
+        st.session_state.chat.append({"role": "assistant", "content": reply})
+        st.session_state.memory.record_turn(
+            user_input, reply, llm.summarizer(client, MODEL_NAME)
+        )
 
-    # Save to JSON
-    save_interaction(user_input, reply)
+        # Save to JSON
+        save_interaction(user_input, reply)
+        get_quiz_pool(DATA_FILE).refill()
+    except Exception as e:
+        st.error(f"Error: {e}")
 
 # ---------------- SIDEBAR ----------------
 st.sidebar.header("Saved Chat History")
 
-if st.sidebar.button("Load saved chats"):
-    data = load_data()
-    for item in data["interactions"]:
-        st.sidebar.markdown(
-            f"**Q:** {item['query']}\n\n"
-            f"**A:** {item['response']}\n\n"
-            f"⏱ {item['time']}\n---"
-        )
+if st.sidebar.toggle("Load saved chats"):
+    history_browser.render_history(DATA_FILE, "history_page", format_history_item, field="query")
 # --------------QUIZ FUNCTIONALITY---------
 st.sidebar.divider()
 st.sidebar.header("📝 Quiz Mode")
 
 if st.sidebar.button("Quiz me"):
-    quiz_source = get_random_query_from_history()
-
-    if quiz_source is None:
-        st.sidebar.warning("No chat history available to generate a quiz.")
-    else:
-        quiz_prompt = (
-            "Create a short conceptual quiz question based on the following topic. "
-            "Do NOT give the answer.\n\n"
-            f"Topic: {quiz_source}"
-        )
-
-        quiz_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=quiz_prompt)]
-                )
-            ]
-        )
-
-        st.session_state.quiz_topic = quiz_source
-        st.session_state.quiz_question = quiz_response.text
+    try:
+        quiz = next_quiz()
+        if quiz is None:
+            st.sidebar.warning("No chat history available to generate a quiz.")
+        else:
+            st.session_state.quiz_topic, st.session_state.quiz_question = quiz
+    except Exception as e:
+        st.sidebar.error(f"Error generating quiz: {e}")
 if st.session_state.quiz_question:
     st.sidebar.markdown("### 🧠 Quiz Question")
     st.sidebar.markdown(st.session_state.quiz_question)
@@ -210,25 +200,17 @@ if st.session_state.quiz_question:
     )
 
     if st.sidebar.button("Submit answer"):
-        evaluation_prompt = (
-            "You are an examiner.\n\n"
-            f"Topic: {st.session_state.quiz_topic}\n\n"
-            f"Question: {st.session_state.quiz_question}\n\n"
-            f"Student Answer: {user_answer}\n\n"
-            "Decide whether the answer is correct or incorrect. "
-            "Start your response with either 'Correct:' or 'Incorrect:' "
-            "and then give a brief explanation."
-        )
-
-        evaluation_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=evaluation_prompt)]
-                )
-            ]
-        )
+        try:
+            grade = grading.grade_answer(
+                client, MODEL_NAME, st.session_state.quiz_topic, st.session_state.quiz_question, user_answer
+            )
+            st.sidebar.markdown("### Evaluation")
+            st.sidebar.markdown(grading.format_grade(grade))
+            question_bank.get_bank(BANK_FILE).record_answer(
+                st.session_state.quiz_question, user_answer, grade
+            )
+        except Exception as e:
+            st.sidebar.error(f"Evaluation error: {e}")
 
-        st.sidebar.markdown("### Evaluation")
-        st.sidebar.markdown(evaluation_response.text)
\ No newline at end of file
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
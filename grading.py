@@ -0,0 +1,115 @@
+"""Grading quiz answers with structured (JSON) output.
+
+The examiner returns ``{"verdict", "score", "feedback"}`` against a
+response schema instead of free text, so the verdict no longer depends on
+the reply starting with "Correct:". ``parse_grade`` is the one place a
+reply becomes a grade, for single answers here and for batches in
+``review``.
+"""
+import json
+import logging
+import re
+
+from google.genai import types
+
+import llm
+
+logger = logging.getLogger(__name__)
+
+VERDICTS = ["correct", "partially_correct", "incorrect"]
+PASS_SCORE = 0.7  # A partially correct answer at or above this counts as correct
+
+GRADE_PROPERTIES = {
+    "verdict": types.Schema(type=types.Type.STRING, enum=VERDICTS),
+    "score": types.Schema(type=types.Type.NUMBER, minimum=0, maximum=1),
+    "feedback": types.Schema(type=types.Type.STRING)
+}
+
+GRADE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties=GRADE_PROPERTIES,
+    required=["verdict", "score", "feedback"]
+)
+
+INSTRUCTIONS = (
+    "Give a verdict of correct, partially_correct or incorrect, a score from 0 to 1 "
+    "and brief feedback for the student."
+)
+
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+LEADING_VERDICT = re.compile(r"^\W*(partially correct|incorrect|correct)\b", re.IGNORECASE)
+
+
+def build_prompt(topic, question, answer, guidance=""):
+    return (
+        "You are an examiner.\n\n"
+        f"Topic: {topic}\n\n"
+        f"Question: {question}\n\n"
+        f"Student Answer: {answer or '(no answer)'}\n\n"
+        f"Decide whether the answer is correct. {guidance}{INSTRUCTIONS}"
+    )
+
+
+def _grade(verdict, score, feedback):
+    if verdict not in VERDICTS:
+        verdict = "incorrect"
+    try:
+        score = min(1.0, max(0.0, float(score)))
+    except (TypeError, ValueError):
+        score = {"correct": 1.0, "partially_correct": 0.5}.get(verdict, 0.0)
+    correct = verdict == "correct" or (verdict == "partially_correct" and score >= PASS_SCORE)
+    return {"verdict": verdict, "score": score, "correct": correct, "feedback": str(feedback or "")}
+
+
+def from_item(item):
+    """A grade from one decoded JSON object"""
+    verdict = str(item.get("verdict", "")).strip().lower().replace(" ", "_")
+    return _grade(verdict, item.get("score"), item.get("feedback"))
+
+
+def parse_grade(text):
+    """
+    The grade in a model reply. A reply that is not the expected JSON (a
+    model ignoring the schema) falls back to a verdict word at its start;
+    anything else counts as incorrect.
+    """
+    text = CODE_FENCE.sub("", (text or "").strip())
+    try:
+        item = json.loads(text)
+    except json.JSONDecodeError:
+        item = None
+    if isinstance(item, dict):
+        return from_item(item)
+
+    logger.warning("Grading reply was not JSON: %.200s", text)
+    match = LEADING_VERDICT.match(text)
+    verdict = match.group(1).lower().replace(" ", "_") if match else "incorrect"
+    return _grade(verdict, None, text)
+
+
+def grade_answer(client, model, topic, question, answer, guidance=""):
+    """Grade one answer; see ``parse_grade`` for the result"""
+    text = llm.generate_text(
+        client, model, llm.user_content(build_prompt(topic, question, answer, guidance)),
+        llm.json_config(GRADE_SCHEMA), cache=False, site="grading"
+    )
+    return parse_grade(text)
+
+
+async def agrade_answer(client, model, topic, question, answer, guidance=""):
+    """Coroutine form of ``grade_answer``, for running beside other calls"""
+    text = await llm.agenerate_text(
+        client, model, llm.user_content(build_prompt(topic, question, answer, guidance)),
+        llm.json_config(GRADE_SCHEMA), cache=False, site="grading"
+    )
+    return parse_grade(text)
+
+
+def format_grade(grade):
+    """Markdown for a grade: verdict, score and feedback"""
+    label = {
+        "correct": "✅ Correct",
+        "partially_correct": "🟡 Partially correct",
+        "incorrect": "❌ Incorrect"
+    }[grade["verdict"]]
+    return f"**{label}** ({grade['score']:.0%})\n\n{grade['feedback']}"
@@ -0,0 +1,81 @@
+"""Paged chat-history browser for the bots' sidebars.
+
+Only one page of records is read from storage and rendered per rerun, so
+the cost is set by the page size rather than the length of the history.
+Each record is one markdown element; long text is cut to a preview with a
+"Show more" button, and at most one record is expanded at a time. A search
+box above the list swaps the pages for ranked full-text matches.
+"""
+import streamlit as st
+
+import search
+import storage
+
+ELEMENT_BUDGET = 45     # Elements per page, navigation included
+ELEMENTS_PER_ITEM = 2   # Markdown plus an optional "Show more" button
+NAV_ELEMENTS = 5        # Newer / older buttons, their columns and the page caption
+PAGE_SIZE = (ELEMENT_BUDGET - NAV_ELEMENTS) // ELEMENTS_PER_ITEM
+PREVIEW_CHARS = 280
+
+
+def _shortener(expanded, cut):
+    def shorten(text):
+        text = str(text)
+        if expanded or len(text) <= PREVIEW_CHARS:
+            return text
+        cut.append(True)
+        return text[:PREVIEW_CHARS].rstrip() + "…"
+    return shorten
+
+
+def render_history(path, key, format_item, field=None, container=None):
+    """
+    Show one page of ``path``'s history. ``format_item(item, shorten)``
+    returns the markdown for a record and should pass long text through
+    ``shorten``. ``key`` keeps each bot's paging state apart, and ``field``
+    limits the listing to records that have it (e.g. "query").
+    """
+    container = container or st.sidebar
+    text = container.text_input("🔍 Search saved chats", key=f"{key}_search")
+    if text.strip():
+        render_matches(path, text, format_item, field, container)
+        return
+
+    state = st.session_state.setdefault(key, {"cursors": [None], "expanded": None})
+    items, next_cursor = storage.page_interactions(path, state["cursors"][-1], PAGE_SIZE, field)
+    if not items and next_cursor is None and len(state["cursors"]) == 1:
+        container.info("No chat history yet!")
+        return
+    if not items:
+        # A long stretch without matching records; the next page carries on past it
+        container.caption("No saved chats in this stretch of the history.")
+
+    for item in items:
+        expanded = state["expanded"] == item["id"]
+        cut = []
+        container.markdown(format_item(item, _shortener(expanded, cut)))
+        if cut or expanded:
+            label = "Show less" if expanded else "Show more"
+            if container.button(label, key=f"{key}_more_{item['id']}"):
+                state["expanded"] = None if expanded else item["id"]
+                st.rerun()
+
+    newer, older = container.columns(2)
+    if len(state["cursors"]) > 1 and newer.button("⬅️ Newer", key=f"{key}_newer"):
+        state["cursors"].pop()
+        st.rerun()
+    if next_cursor is not None and older.button("Older ➡️", key=f"{key}_older"):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+    container.caption(f"Page {len(state['cursors'])}")
+
+
+def render_matches(path, text, format_item, field, container):
+    """The best full-text matches for ``text``, with the matching words in bold"""
+    matches = search.search(path, text, PAGE_SIZE, field)
+    if not matches:
+        container.info("No saved chats match that search.")
+        return
+    for item, terms in matches:
+        container.markdown(format_item(item, lambda value: search.snippet(value, terms)))
+    container.caption(f"{len(matches)} best matching chats, best first")
@@ -0,0 +1,171 @@
+"""Shared helpers for calling Gemini from the bots.
+
+Every request goes through ``resilience`` for pacing, retries and the
+circuit breaker, and is timed in ``metrics``.
+"""
+import httpx
+import streamlit as st
+from google import genai
+from google.genai import types
+
+import metrics
+import resilience
+import response_cache
+
+# Connections kept open to the API between calls; reruns reuse them
+HTTP_LIMITS = httpx.Limits(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=60
+)
+
+
+@st.cache_resource
+def get_client(api_key):
+    """
+    One Gemini client per process and key. Streamlit re-executes the script
+    on every interaction, so building the client at module level would redo
+    its setup and TLS handshakes on every click.
+    """
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(client_args={"limits": HTTP_LIMITS})
+    )
+
+
+@st.cache_resource
+def get_generative_model(api_key, model_name, system_instruction=None):
+    """Cached ``google.generativeai`` model handle, used by the Socratic tutor"""
+    import google.generativeai as generativeai
+
+    generativeai.configure(api_key=api_key)
+    return generativeai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+def user_content(text):
+    return [types.Content(role="user", parts=[types.Part(text=text)])]
+
+
+def json_config(schema):
+    """Config asking for a JSON reply that matches ``schema``"""
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema
+    )
+
+
+def chat_contents(messages, text):
+    """Earlier (role, text) messages followed by the new user turn"""
+    history = [types.Content(role=role, parts=[types.Part(text=part)]) for role, part in messages]
+    return history + user_content(text)
+
+
+def summarizer(client, model):
+    """A ``summarize(prompt)`` callable for ``memory.ConversationMemory``"""
+    return lambda prompt: generate_text(
+        client, model, user_content(prompt), cache=False, site="summary"
+    )
+
+
+def model_summarizer(model):
+    """``summarizer`` for a ``google.generativeai`` model, as the Socratic tutor uses"""
+    def summarize(prompt):
+        with metrics.timed("generate_content", "summary") as call:
+            response = resilience.call(model.generate_content, prompt)
+            metrics.add_usage(call, getattr(response, "usage_metadata", None))
+            return response.text
+    return summarize
+
+
+def _cached_text(store, key):
+    text = store.get(key)
+    metrics.add("cache_hits" if text is not None else "cache_misses")
+    return text
+
+
+def generate_text(client, model, contents, config=None, cache=True, site="other"):
+    """
+    Return the response text for a request, served from the on-disk response
+    cache when an identical request was made before. Pass ``cache=False`` for
+    calls whose answer must be fresh, such as grading a student's answer.
+    ``site`` labels the call in ``metrics`` (quiz-gen, grading, ...).
+    """
+    with metrics.timed("generate_content", site) as call:
+        store = response_cache.get_cache() if cache else None
+        if store is not None:
+            key = response_cache.make_key(model, contents, config)
+            text = _cached_text(store, key)
+            if text is not None:
+                return text
+
+        response = resilience.call(
+            client.models.generate_content,
+            model=model,
+            contents=contents,
+            config=config
+        )
+        metrics.add_usage(call, response.usage_metadata)
+        text = response.text
+        if store is not None and text:
+            store.put(key, text)
+        return text
+
+
+async def agenerate_text(client, model, contents, config=None, cache=True, site="other"):
+    """
+    Coroutine form of ``generate_text`` on the client's async API, for
+    calls run side by side with ``pipeline.run_all``.
+    """
+    with metrics.timed("generate_content", site) as call:
+        store = response_cache.get_cache() if cache else None
+        if store is not None:
+            key = response_cache.make_key(model, contents, config)
+            text = _cached_text(store, key)
+            if text is not None:
+                return text
+
+        response = await resilience.acall(
+            client.aio.models.generate_content,
+            model=model,
+            contents=contents,
+            config=config
+        )
+        metrics.add_usage(call, response.usage_metadata)
+        text = response.text
+        if store is not None and text:
+            store.put(key, text)
+        return text
+
+
+def _chunk_texts(chunks, call):
+    for chunk in chunks:
+        # Streams report usage on the last chunk; keep the latest seen
+        metrics.add_usage(call, getattr(chunk, "usage_metadata", None))
+        try:
+            text = chunk.text
+        except ValueError:
+            # Final chunks can carry only finish metadata and no parts
+            continue
+        if text:
+            yield text
+
+
+def stream_text(client, model, contents, config=None, site="chat"):
+    """
+    Yield response text as it is generated, for use with ``st.write_stream``,
+    which renders each chunk and returns the full reply once it completes.
+    """
+    with metrics.timed("generate_content_stream", site) as call:
+        chunks = resilience.stream(lambda: client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config
+        ))
+        yield from _chunk_texts(chunks, call)
+
+
+def stream_chat(chat, message, site="socratic", **kwargs):
+    """Streaming counterpart of ``chat.send_message`` for chat sessions"""
+    with metrics.timed("send_message", site) as call:
+        chunks = resilience.stream(lambda: chat.send_message(message, stream=True, **kwargs))
+        yield from _chunk_texts(chunks, call)
@@ -0,0 +1,126 @@
+"""Token-budgeted conversation memory with a rolling summary.
+
+Recent turns are kept verbatim up to ``WINDOW_TOKENS``. Older turns drop out
+of the window and, once enough of them have piled up, are folded into a
+short running summary by one model call. Every turn's token count is
+computed once when it is added, so the prompt sent with each message has
+a fixed ceiling however long the conversation gets.
+"""
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WINDOW_TOKENS = 1500   # Verbatim recent turns
+SUMMARY_TOKENS = 300   # Running summary of everything older
+FOLD_TOKENS = 400      # Evicted turns to collect before re-summarizing
+TRUNCATED = " …[truncated]"
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    def __init__(self, window_tokens=WINDOW_TOKENS, summary_tokens=SUMMARY_TOKENS,
+                 count_tokens=estimate_tokens):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.count_tokens = count_tokens
+        self.turns = deque()  # {"role", "content", "tokens"}
+        self.window_used = 0
+        self.user_turns = 0   # Exchanges in the window, counted by their user turn
+        self.evicted = []
+        self.evicted_tokens = 0
+        self.summary = ""
+
+    def add(self, role, content):
+        """
+        Add a message (role "user" or "model") and slide the window. Whole
+        exchanges are evicted, so the window always starts on a user turn
+        and the newest exchange is always kept; if that exchange alone is
+        over budget, its longest message is cut down to fit.
+        """
+        tokens = self.count_tokens(content)
+        self.turns.append({"role": role, "content": content, "tokens": tokens})
+        self.window_used += tokens
+        self.user_turns += role == "user"
+        while self.window_used > self.window_tokens and self.user_turns > 1:
+            self._evict()
+            while self.turns[0]["role"] != "user":
+                self._evict()
+        while self.window_used > self.window_tokens and self._truncate_longest():
+            pass
+
+    def _truncate_longest(self):
+        """Shorten the longest turn by the excess; False once nothing can be cut"""
+        turn = max(self.turns, key=lambda turn: turn["tokens"])
+        excess = self.window_used - self.window_tokens
+        budget = turn["tokens"] - excess - self.count_tokens(TRUNCATED)
+        keep = len(turn["content"]) * max(0, budget) // turn["tokens"]
+        content = turn["content"][:keep] + TRUNCATED
+        tokens = self.count_tokens(content)
+        if tokens >= turn["tokens"]:
+            return False
+        turn["content"] = content
+        self.window_used -= turn["tokens"] - tokens
+        turn["tokens"] = tokens
+        return True
+
+    def _evict(self):
+        turn = self.turns.popleft()
+        self.window_used -= turn["tokens"]
+        self.user_turns -= turn["role"] == "user"
+        self.evicted.append(turn)
+        self.evicted_tokens += turn["tokens"]
+
+    def record_turn(self, user_text, reply, summarize):
+        """Add one exchange, folding old turns into the summary when due"""
+        self.add("user", user_text)
+        self.add("model", reply)
+        if self.evicted_tokens >= FOLD_TOKENS:
+            self.fold(summarize)
+
+    def fold_prompt(self):
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in self.evicted)
+        words = self.summary_tokens * 3 // 4
+        return (
+            "Update the running summary of a conversation with the new messages below. "
+            "Keep the facts, topics and open questions the assistant will need later. "
+            f"Reply with the summary only, in under {words} words.\n\n"
+            f"Current summary:\n{self.summary or '(none yet)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+
+    def fold(self, summarize):
+        """``summarize(prompt)`` returns text; it is called once per fold"""
+        if not self.evicted:
+            return
+        try:
+            summary = summarize(self.fold_prompt()).strip()
+        except Exception:
+            # Keep the evicted turns and try again on a later turn
+            logger.warning("Could not update the conversation summary", exc_info=True)
+            return
+        # Hard cap in case the model ignores the requested length
+        self.summary = summary[:self.summary_tokens * 4]
+        self.evicted = []
+        self.evicted_tokens = 0
+
+    def messages(self):
+        """Earlier context as (role, text) pairs to send before the new prompt"""
+        messages = []
+        if self.summary:
+            messages.append(("user", f"Summary of our earlier conversation:\n{self.summary}"))
+            messages.append(("model", "Got it, I'll keep that in mind."))
+        messages.extend((turn["role"], turn["content"]) for turn in self.turns)
+        return messages
+
+    def clear(self):
+        self.turns.clear()
+        self.window_used = 0
+        self.user_turns = 0
+        self.evicted = []
+        self.evicted_tokens = 0
+        self.summary = ""
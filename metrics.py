@@ -0,0 +1,250 @@
+"""Per-call timing, token, byte and cache counters for model and storage calls.
+
+Wrap a call in ``with metrics.timed(operation, site) as call:`` and fill in
+``call["tokens_in"]`` and friends; code running inside the block (a disk
+read, a cache lookup) can add to the innermost open call with
+``metrics.add``. Totals are kept per (operation, site) in this process:
+
+- ``prometheus_text()`` renders them in the Prometheus text format, and
+  ``CHAT_METRICS_PORT=<port>`` serves that on ``/metrics``
+- ``CHAT_METRICS_TRACE=<file>`` appends one JSON line per call
+- ``debug_panel()`` shows them in the sidebar when the URL has ``?debug=1``
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # Seconds
+COUNTERS = [
+    "tokens_in", "tokens_out", "bytes_read", "bytes_written", "cache_hits", "cache_misses", "retries"
+]
+RECENT_CALLS = 50
+
+TRACE_FILE = os.getenv("CHAT_METRICS_TRACE")
+METRICS_PORT = os.getenv("CHAT_METRICS_PORT")
+
+_current = contextvars.ContextVar("metrics_call", default=None)
+
+
+class Series:
+    """Latency histogram and counters for one (operation, site)"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.errors = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, call):
+        self.buckets[bisect.bisect_left(BUCKETS, call["seconds"])] += 1
+        self.count += 1
+        self.total_seconds += call["seconds"]
+        self.errors += call["error"]
+        for name in COUNTERS:
+            self.counters[name] += call[name]
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-th quantile"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS + [float("inf")], self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    def __init__(self, trace_file=None):
+        self.lock = threading.Lock()
+        self.series = {}  # (operation, site) -> Series
+        self.recent = deque(maxlen=RECENT_CALLS)
+        self.trace_file = trace_file
+
+    def record(self, call):
+        with self.lock:
+            key = (call["operation"], call["site"])
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.observe(call)
+            self.recent.append(call)
+            if self.trace_file:
+                with open(self.trace_file, "a") as f:
+                    f.write(json.dumps(call) + "\n")
+
+    def snapshot(self):
+        with self.lock:
+            return {key: series for key, series in sorted(self.series.items())}, list(self.recent)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+            self.recent.clear()
+
+
+registry = Registry(TRACE_FILE)
+
+
+@contextmanager
+def timed(operation, site):
+    """Time a call; the yielded dict takes token, byte and cache counts"""
+    call = dict.fromkeys(COUNTERS, 0)
+    call.update(operation=operation, site=site, error=False)
+    token = _current.set(call)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call["error"] = True
+        raise
+    finally:
+        call["seconds"] = time.perf_counter() - start
+        call["time"] = datetime.now().isoformat()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # A stream closed from another context (e.g. garbage collected)
+            pass
+        registry.record(call)
+
+
+def add(counter, amount=1):
+    """Add to a counter of the innermost call being timed, if any"""
+    call = _current.get()
+    if call is not None:
+        call[counter] += amount
+
+
+def add_usage(call, usage):
+    """Copy token counts from a response's ``usage_metadata``"""
+    if usage is None:
+        return
+    call["tokens_in"] = getattr(usage, "prompt_token_count", None) or 0
+    call["tokens_out"] = getattr(usage, "candidates_token_count", None) or 0
+
+
+# ---------------- EXPORT ----------------
+def _labels(operation, site, **extra):
+    pairs = {"operation": operation, "site": site, **extra}
+    return ",".join(f'{name}="{value}"' for name, value in pairs.items())
+
+
+def _histogram_samples(operation, site, s):
+    cumulative = 0
+    for bound, count in zip(BUCKETS + ["+Inf"], s.buckets):
+        cumulative += count
+        yield "_bucket", _labels(operation, site, le=bound), cumulative
+    yield "_sum", _labels(operation, site), s.total_seconds
+    yield "_count", _labels(operation, site), s.count
+
+
+def _split_samples(label, pairs):
+    """Samples of one counter split by a label, e.g. tokens by direction"""
+    def samples(operation, site, s):
+        for value, name in pairs:
+            yield "", _labels(operation, site, **{label: value}), s.counters[name]
+    return samples
+
+
+# (family, type, samples(operation, site, series) -> (suffix, labels, value))
+FAMILIES = [
+    ("chatbot_call_duration_seconds", "histogram", _histogram_samples),
+    ("chatbot_call_errors_total", "counter",
+     lambda operation, site, s: [("", _labels(operation, site), s.errors)]),
+    ("chatbot_call_retries_total", "counter",
+     lambda operation, site, s: [("", _labels(operation, site), s.counters["retries"])]),
+    ("chatbot_tokens_total", "counter",
+     _split_samples("direction", [("prompt", "tokens_in"), ("output", "tokens_out")])),
+    ("chatbot_bytes_total", "counter",
+     _split_samples("direction", [("read", "bytes_read"), ("written", "bytes_written")])),
+    ("chatbot_cache_requests_total", "counter",
+     _split_samples("result", [("hit", "cache_hits"), ("miss", "cache_misses")]))
+]
+
+
+def prometheus_text():
+    """Text exposition format: each family's samples grouped under its TYPE line"""
+    series, _ = registry.snapshot()
+    lines = []
+    for family, kind, samples in FAMILIES:
+        lines.append(f"# TYPE {family} {kind}")
+        for (operation, site), s in series.items():
+            for suffix, labels, value in samples(operation, site, s):
+                lines.append(f"{family}{suffix}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port=METRICS_PORT):
+    """Serve ``/metrics`` on a daemon thread, once per process; no-op without a port"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("", int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
+
+
+# ---------------- DEBUG PANEL ----------------
+def debug_panel():
+    """Per-call-site table in the sidebar, shown with ``?debug=1`` in the URL"""
+    import streamlit as st
+
+    if st.query_params.get("debug") != "1":
+        return
+    series, recent = registry.snapshot()
+    with st.sidebar.expander("🔧 Debug: call metrics", expanded=True):
+        st.dataframe([
+            {
+                "operation": operation,
+                "site": site,
+                "calls": s.count,
+                "mean ms": round(s.total_seconds / s.count * 1000, 1),
+                "p95 ≤ s": s.quantile(0.95),
+                "errors": s.errors,
+                "retries": s.counters["retries"],
+                "tokens in/out": f"{s.counters['tokens_in']}/{s.counters['tokens_out']}",
+                "KiB read/written": f"{s.counters['bytes_read'] // 1024}/{s.counters['bytes_written'] // 1024}",
+                "cache hit/miss": f"{s.counters['cache_hits']}/{s.counters['cache_misses']}"
+            }
+            for (operation, site), s in series.items()
+        ])
+        st.caption("Most recent calls")
+        st.dataframe([
+            {"operation": c["operation"], "site": c["site"], "ms": round(c["seconds"] * 1000, 1)}
+            for c in reversed(recent)
+        ])
+        if st.button("Reset metrics"):
+            registry.clear()
+
+
+serve()
@@ -1,14 +1,27 @@
 import streamlit as st
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 import random
-import json
+import asyncio
+import functools
 import os
 from datetime import datetime, timedelta
 from collections import Counter
 import time
 
+import achievements
+import grading
+import history_browser
+import llm
+import memory
+import metrics
+import pipeline
+import question_bank
+import quiz_pool
+import retrieval
+import storage
+import topics
+import users
+
 # ---------------- CONFIG ----------------
 st.set_page_config(
     page_title="🚀 SmartBot Pro",
@@ -16,11 +29,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = llm.get_client(os.getenv("GEMINI_API_KEY"))
 
 MODEL_NAME = "gemini-2.5-flash-lite"
-DATA_FILE = "chat_history.json"
-STATS_FILE = "user_stats.json"
+DATA_FILE = storage.user_path("chat_history.json", users.current_user_id())
+BANK_FILE = storage.user_path("question_bank.json", users.current_user_id())
+STATS_FILE = storage.user_path("user_stats.json", users.current_user_id())
 ACHIEVEMENTS_FILE = "achievements.json"
 
 # ---------------- AI PERSONALITIES ----------------
@@ -51,162 +65,107 @@ PERSONALITIES = {
     }
 }
 
-# ---------------- ACHIEVEMENTS ----------------
-ACHIEVEMENTS = {
-    "first_chat": {"name": "🎉 First Steps", "desc": "Had your first conversation", "points": 10},
-    "chat_5": {"name": "💬 Chatty", "desc": "Had 5 conversations", "points": 25},
-    "chat_25": {"name": "🗣️ Conversationalist", "desc": "Had 25 conversations", "points": 50},
-    "chat_100": {"name": "🏆 Chat Master", "desc": "Had 100 conversations", "points": 100},
-    "streak_3": {"name": "🔥 On Fire", "desc": "3-day streak", "points": 30},
-    "streak_7": {"name": "🌟 Dedicated", "desc": "7-day streak", "points": 75},
-    "quiz_master": {"name": "🧠 Quiz Master", "desc": "Scored 5 perfect quizzes", "points": 50},
-    "night_owl": {"name": "🦉 Night Owl", "desc": "Chatted past midnight", "points": 15},
-    "early_bird": {"name": "🌅 Early Bird", "desc": "Chatted before 6 AM", "points": 15},
-    "topic_explorer": {"name": "🌍 Explorer", "desc": "Discussed 10+ different topics", "points": 40},
-    "long_conversation": {"name": "📖 Deep Thinker", "desc": "Had a 20+ message conversation", "points": 35},
-    "personality_switcher": {"name": "🎭 Shapeshifter", "desc": "Tried all AI personalities", "points": 60}
-}
-
 # ---------------- JSON HELPERS ----------------
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"interactions": []}
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return {"interactions": []}
+    return storage.load_data(DATA_FILE)
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    storage.save_data(DATA_FILE, data)
 
 def load_stats():
-    if not os.path.exists(STATS_FILE):
-        return {
-            "total_messages": 0,
-            "quiz_score": 0,
-            "quiz_attempts": 0,
-            "topics": [],
-            "last_chat_date": None,
-            "streak_days": 0,
-            "personalities_used": [],
-            "total_points": 0,
-            "level": 1,
-            "unlocked_achievements": []
-        }
-    try:
-        with open(STATS_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return load_stats()
+    # Pick up any stats write still queued from the previous turn
+    pipeline.get_writer().flush()
+    return storage.load_json(STATS_FILE, achievements.DEFAULT_STATS)
 
 def save_stats(stats):
-    with open(STATS_FILE, "w") as f:
-        json.dump(stats, f, indent=4)
+    storage.save_json(STATS_FILE, stats)
+
+def save_stats_in_background(stats):
+    pipeline.get_writer().submit(save_stats, stats)
+
+def get_achievement_engine():
+    """Stats for this turn; events update them in memory until flushed"""
+    return achievements.AchievementEngine(load_stats(), len(PERSONALITIES))
 
 def save_interaction(query, response, topic=None, personality=None):
-    data = load_data()
-    data["interactions"].append({
+    """Save a chat turn and update stats; returns newly unlocked achievements"""
+    storage.append_interaction(DATA_FILE, {
         "query": query,
         "response": response,
         "topic": topic,
         "personality": personality,
         "time": datetime.now().isoformat()
     })
-    save_data(data)
-    
-    # Update stats
-    stats = load_stats()
-    stats["total_messages"] += 1
-    
-    if topic and topic not in stats["topics"]:
-        stats["topics"].append(topic)
-    
-    if personality and personality not in stats["personalities_used"]:
-        stats["personalities_used"].append(personality)
-    
-    # Update streak
-    today = datetime.now().date()
-    if stats["last_chat_date"]:
-        last_date = datetime.fromisoformat(stats["last_chat_date"]).date()
-        if (today - last_date).days == 1:
-            stats["streak_days"] += 1
-        elif (today - last_date).days > 1:
-            stats["streak_days"] = 1
-    else:
-        stats["streak_days"] = 1
-    
-    stats["last_chat_date"] = datetime.now().isoformat()
-    
-    # Calculate level (every 100 points = 1 level)
-    stats["level"] = 1 + (stats["total_points"] // 100)
     
-    save_stats(stats)
-    check_achievements()
+    engine = get_achievement_engine()
+    engine.record_message(topic, personality)
+    return engine.flush(save_stats_in_background)
 
-def get_random_query_from_history():
-    data = load_data()
-    interactions = data.get("interactions", [])
-    if not interactions:
-        return None
-    return random.choice(interactions)["query"]
+def format_history_item(item, shorten):
+    topic = f" · {item['topic']}" if item.get("topic") else ""
+    return (
+        f"**Q:** {shorten(item['query'])}\n\n"
+        f"**A:** {shorten(item.get('response', ''))}\n\n"
+        f"⏱ {item.get('time', '')}{topic}\n---"
+    )
 
-def check_achievements():
-    """Check and unlock achievements"""
-    stats = load_stats()
-    newly_unlocked = []
-    
-    achievements_to_check = {
-        "first_chat": stats["total_messages"] >= 1,
-        "chat_5": stats["total_messages"] >= 5,
-        "chat_25": stats["total_messages"] >= 25,
-        "chat_100": stats["total_messages"] >= 100,
-        "streak_3": stats["streak_days"] >= 3,
-        "streak_7": stats["streak_days"] >= 7,
-        "quiz_master": stats.get("quiz_score", 0) >= 5,
-        "topic_explorer": len(stats["topics"]) >= 10,
-        "long_conversation": stats["total_messages"] >= 20,
-        "personality_switcher": len(stats["personalities_used"]) >= len(PERSONALITIES)
-    }
-    
-    # Time-based achievements
-    hour = datetime.now().hour
-    if hour >= 0 and hour < 6:
-        achievements_to_check["early_bird"] = True
-    if hour >= 23 or hour < 2:
-        achievements_to_check["night_owl"] = True
-    
-    for ach_id, condition in achievements_to_check.items():
-        if condition and ach_id not in stats["unlocked_achievements"]:
-            stats["unlocked_achievements"].append(ach_id)
-            stats["total_points"] += ACHIEVEMENTS[ach_id]["points"]
-            newly_unlocked.append(ACHIEVEMENTS[ach_id]["name"])
-    
-    save_stats(stats)
-    return newly_unlocked
-
-def extract_topics_from_text(text):
-    """Simple topic extraction using keywords"""
-    topics = {
-        "Science": ["science", "physics", "chemistry", "biology", "experiment"],
-        "Technology": ["code", "programming", "computer", "ai", "software", "tech"],
-        "Math": ["math", "calculate", "equation", "number", "algebra"],
-        "History": ["history", "historical", "past", "ancient", "war"],
-        "Art": ["art", "painting", "music", "creative", "design"],
-        "Philosophy": ["philosophy", "meaning", "ethics", "existence"],
-        "General": []
-    }
-    
-    text_lower = text.lower()
-    for topic, keywords in topics.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return topic
-    return "General"
+# ---------------- QUIZ PRE-GENERATION ----------------
+def build_quiz_prompt(topic):
+    return (
+        "Create a challenging quiz question based on this topic. "
+        "Make it thought-provoking. Do NOT give the answer.\n\n"
+        f"Topic: {topic}"
+    )
+
+def generate_quiz_question(topic, existing=()):
+    # A variant must differ from the banked ones, so only a first question is cached
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return llm.generate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
+
+async def agenerate_quiz_question(topic, existing=()):
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return await llm.agenerate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
+
+def quiz_question(source_id, topic):
+    """A banked question for this source, generated only when its bank runs dry"""
+    return question_bank.get_bank(BANK_FILE).question_for(source_id, topic, generate_quiz_question)
+
+async def aquiz_question(source_id, topic):
+    # Loading the bank reads the file under its lock; keep that off the event loop
+    bank = await asyncio.to_thread(question_bank.get_bank, BANK_FILE)
+    return await bank.aquestion_for(source_id, topic, agenerate_quiz_question)
+
+def pick_quiz_source(data_file, exclude):
+    """A past query unlike the ones already buffered"""
+    return retrieval.sample_source(data_file, exclude)
+
+@st.cache_resource(max_entries=users.MAX_ACTIVE_USERS)
+def get_quiz_pool(data_file):
+    """Quiz questions generated ahead of time on worker threads, per history file"""
+    return quiz_pool.QuizPool(functools.partial(pick_quiz_source, data_file), quiz_question)
+
+def next_quiz():
+    """Return (topic, question), using a pre-generated question when one is ready"""
+    pool = get_quiz_pool(DATA_FILE)
+    # Prepared while the previous answer was being graded
+    ready = st.session_state.pop("upcoming_quiz", None) or pool.pop()
+    pool.refill()
+    if ready:
+        return ready[1], ready[2]
+    source = retrieval.sample_source(DATA_FILE)
+    if source is None:
+        return None
+    return source[1], quiz_question(*source)
 
 # ---------------- SESSION STATE INIT ----------------
 if "chat" not in st.session_state:
     st.session_state.chat = []
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
 if "counter" not in st.session_state:
     st.session_state.counter = 0
 if "quiz_question" not in st.session_state:
@@ -263,6 +222,7 @@ with st.sidebar:
         index=0
     )
     st.session_state.conversation_mode = mode
+    use_related = st.checkbox("📎 Recall related past chats", value=False)
     
     st.divider()
     
@@ -286,10 +246,10 @@ with st.sidebar:
     st.subheader("⚡ Quick Actions")
     
     if st.button("🎲 Random Topic Suggestion"):
-        topics = ["Explain quantum computing", "What is consciousness?", 
+        suggestions = ["Explain quantum computing", "What is consciousness?", 
                  "How do black holes work?", "Tell me about ancient civilizations",
                  "Explain machine learning", "What is the meaning of life?"]
-        st.info(f"💡 Try: {random.choice(topics)}")
+        st.info(f"💡 Try: {random.choice(suggestions)}")
     
     if st.button("📝 Generate Writing Prompt"):
         prompts = [
@@ -304,17 +264,16 @@ with st.sidebar:
     
     # Chat history
     st.subheader("💾 Chat History")
-    if st.button("📜 Load History"):
-        data = load_data()
-        with st.expander("View Past Chats"):
-            for item in data["interactions"][-10:]:  # Last 10
-                st.markdown(f"**Q:** {item['query'][:50]}...")
-                st.caption(f"⏱ {item['time']}")
-                st.divider()
+    # An expander rather than a button, so paging and "Show more" survive reruns
+    history_browser.render_history(
+        DATA_FILE, "history_page", format_history_item, field="query",
+        container=st.expander("📜 Load History")
+    )
     
     if st.button("🗑️ Clear History"):
         save_data({"interactions": []})
         st.session_state.chat = []
+        st.session_state.memory.clear()
         st.success("History cleared!")
         st.rerun()
 
@@ -323,7 +282,7 @@ if st.session_state.show_achievements:
     st.subheader("🏆 Achievements")
     
     cols = st.columns(3)
-    for idx, (ach_id, ach_data) in enumerate(ACHIEVEMENTS.items()):
+    for idx, (ach_id, ach_data) in enumerate(achievements.ACHIEVEMENTS.items()):
         with cols[idx % 3]:
             if ach_id in stats["unlocked_achievements"]:
                 st.success(f"✅ {ach_data['name']}")
@@ -345,24 +304,16 @@ for msg in st.session_state.chat:
 # ---------------- AUTO QUIZ EVERY 5 MESSAGES ----------------
 if st.session_state.counter == 5:
     st.session_state.counter = 0
-    quiz_source = get_random_query_from_history()
+    try:
+        quiz = next_quiz()
+    except Exception as e:
+        quiz = None
+        st.sidebar.error(f"Error generating quiz: {e}")
     
-    if quiz_source:
+    if quiz:
         with st.sidebar:
             st.success("🎉 Auto-Quiz Time!")
-            quiz_prompt = (
-                "Create a short conceptual quiz question based on the following topic. "
-                "Make it challenging but fair. Do NOT give the answer.\n\n"
-                f"Topic: {quiz_source}"
-            )
-            
-            quiz_response = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=[types.Content(role="user", parts=[types.Part(text=quiz_prompt)])]
-            )
-            
-            st.session_state.quiz_topic = quiz_source
-            st.session_state.quiz_question = quiz_response.text
+            st.session_state.quiz_topic, st.session_state.quiz_question = quiz
 
 # ---------------- USER INPUT ----------------
 user_input = st.chat_input("💭 Ask anything or start a conversation...")
@@ -371,7 +322,7 @@ if user_input:
     st.session_state.counter += 1
     
     # Detect topic
-    topic = extract_topics_from_text(user_input)
+    topic = topics.classify(user_input)
     
     # Add user message
     st.session_state.chat.append({"role": "user", "content": user_input, "topic": topic})
@@ -390,56 +341,51 @@ if user_input:
     }
     
     full_prompt = f"{personality_prompt}\n\n{mode_instructions[st.session_state.conversation_mode]}\n\nUser: {user_input}"
+    if use_related:
+        related = retrieval.related_context(DATA_FILE, user_input)
+        if related:
+            full_prompt = f"{related}\n\n{full_prompt}"
     
-    # Generate response with typing effect placeholder
-    with st.chat_message("assistant"):
-        with st.spinner(f"{PERSONALITIES[st.session_state.personality]['emoji']} Thinking..."):
-            response = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=[types.Content(role="user", parts=[types.Part(text=full_prompt)])]
+    try:
+        # Stream the response so the first tokens show up right away
+        context = st.session_state.memory.messages()
+        with st.chat_message("assistant"):
+            reply = st.write_stream(
+                llm.stream_text(client, MODEL_NAME, llm.chat_contents(context, full_prompt))
             )
-            
-            reply = response.text
-            st.markdown(reply)
             st.caption(f"🏷️ Topic: {topic}")
     
-    # Add assistant message
-    st.session_state.chat.append({"role": "assistant", "content": reply, "topic": topic})
-    
-    # Save interaction
-    save_interaction(user_input, reply, topic, st.session_state.personality)
+        # Add assistant message
+        st.session_state.chat.append({"role": "assistant", "content": reply, "topic": topic})
+        st.session_state.memory.record_turn(
+            user_input, reply, llm.summarizer(client, MODEL_NAME)
+        )
     
-    # Check for new achievements
-    new_achievements = check_achievements()
-    if new_achievements:
-        for ach in new_achievements:
-            st.balloons()
-            st.success(f"🎉 Achievement Unlocked: {ach}")
-            time.sleep(0.5)
+        # Save interaction and collect any achievements it unlocked
+        new_achievements = save_interaction(user_input, reply, topic, st.session_state.personality)
+        get_quiz_pool(DATA_FILE).refill()
+    
+        if new_achievements:
+            for ach in new_achievements:
+                st.balloons()
+                st.success(f"🎉 Achievement Unlocked: {ach}")
+                time.sleep(0.5)
+    except Exception as e:
+        st.error(f"Error: {e}")
 
 # ---------------- QUIZ SECTION ----------------
 st.sidebar.divider()
 st.sidebar.header("🧠 Quiz Zone")
 
 if st.sidebar.button("🎯 Generate Quiz"):
-    quiz_source = get_random_query_from_history()
-    
-    if quiz_source is None:
-        st.sidebar.warning("No chat history available. Chat more to unlock quizzes!")
-    else:
-        quiz_prompt = (
-            "Create a challenging quiz question based on this topic. "
-            "Make it thought-provoking. Do NOT give the answer.\n\n"
-            f"Topic: {quiz_source}"
-        )
-        
-        quiz_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[types.Content(role="user", parts=[types.Part(text=quiz_prompt)])]
-        )
-        
-        st.session_state.quiz_topic = quiz_source
-        st.session_state.quiz_question = quiz_response.text
+    try:
+        quiz = next_quiz()
+        if quiz is None:
+            st.sidebar.warning("No chat history available. Chat more to unlock quizzes!")
+        else:
+            st.session_state.quiz_topic, st.session_state.quiz_question = quiz
+    except Exception as e:
+        st.sidebar.error(f"Error generating quiz: {e}")
 
 if st.session_state.quiz_question:
     with st.sidebar:
@@ -452,30 +398,34 @@ if st.session_state.quiz_question:
         with col1:
             if st.button("✅ Submit"):
                 if user_answer.strip():
-                    evaluation_prompt = (
-                        "You are an examiner.\n\n"
-                        f"Topic: {st.session_state.quiz_topic}\n\n"
-                        f"Question: {st.session_state.quiz_question}\n\n"
-                        f"Student Answer: {user_answer}\n\n"
-                        "Evaluate if the answer is correct. Be fair and encouraging. "
-                        "Start with 'Correct:' or 'Incorrect:' then explain why."
-                    )
-                    
-                    evaluation = client.models.generate_content(
-                        model=MODEL_NAME,
-                        contents=[types.Content(role="user", parts=[types.Part(text=evaluation_prompt)])]
-                    )
+                    # Grade and line up the next question at the same time
+                    try:
+                        grade, st.session_state.upcoming_quiz = pipeline.run_all(
+                            grading.agrade_answer(
+                                client, MODEL_NAME, st.session_state.quiz_topic,
+                                st.session_state.quiz_question, user_answer,
+                                guidance="Be fair and encouraging. "
+                            ),
+                            pipeline.optional(get_quiz_pool(DATA_FILE).next_ready(aquiz_question))
+                        )
+                    except Exception as e:
+                        st.error(f"Evaluation error: {e}")
+                        st.stop()
                     
                     st.markdown("### 📊 Evaluation")
-                    st.markdown(evaluation.text)
+                    st.markdown(grading.format_grade(grade))
+                    question_bank.get_bank(BANK_FILE).record_answer(
+                        st.session_state.quiz_question, user_answer, grade
+                    )
                     
                     # Update stats
-                    stats = load_stats()
-                    stats["quiz_attempts"] = stats.get("quiz_attempts", 0) + 1
-                    if evaluation.text.lower().startswith("correct"):
-                        stats["quiz_score"] = stats.get("quiz_score", 0) + 1
+                    is_correct = grade["correct"]
+                    engine = get_achievement_engine()
+                    engine.record_quiz(is_correct)
+                    if is_correct:
                         st.balloons()
-                    save_stats(stats)
+                    for ach in engine.flush(save_stats_in_background):
+                        st.success(f"🎉 Achievement Unlocked: {ach}")
                     
                 else:
                     st.warning("Please enter an answer!")
@@ -493,4 +443,7 @@ with col1:
 with col2:
     st.caption(f"🔥 Current streak: {stats['streak_days']} days")
 with col3:
-    st.caption(f"🎭 Personality: {st.session_state.personality}")
\ No newline at end of file
+    st.caption(f"🎭 Personality: {st.session_state.personality}")
+
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
@@ -0,0 +1,98 @@
+"""Run independent model calls concurrently and persist off the script thread.
+
+Streamlit runs each script on its own thread with no event loop, so one
+loop is started per process on a daemon thread and coroutines are handed
+to it with ``run_all``. Disk writes that nothing on this rerun has to
+read back go to a ``BackgroundWriter`` instead of blocking the script.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- EVENT LOOP ----------------
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """The process-wide event loop, started on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="llm-event-loop",
+                daemon=True
+            ).start()
+        return _loop
+
+
+def run_all(*coros):
+    """
+    Run coroutines concurrently on the shared loop and return their results
+    in order. Blocks the calling thread until the slowest one finishes and
+    raises the first exception, like ``asyncio.gather``.
+    """
+    async def gather():
+        return await asyncio.gather(*coros)
+
+    return asyncio.run_coroutine_threadsafe(gather(), get_loop()).result()
+
+
+async def optional(coro, default=None):
+    """Await ``coro`` but return ``default`` instead of raising, for best-effort work"""
+    try:
+        return await coro
+    except Exception:
+        logger.warning("Background task failed", exc_info=True)
+        return default
+
+
+# ---------------- BACKGROUND WRITER ----------------
+class BackgroundWriter:
+    """Runs write calls one at a time, in submission order, on a daemon thread"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            fn, args, future = self.queue.get()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                logger.warning("Background write failed", exc_info=True)
+                future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)``; returns a Future for its result"""
+        future = Future()
+        self.queue.put((fn, args, future))
+        return future
+
+    def flush(self):
+        """Wait for every queued write, e.g. before reading the same file back"""
+        self.queue.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process-wide background writer"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BackgroundWriter()
+        return _writer
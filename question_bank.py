@@ -0,0 +1,180 @@
+"""Persistent bank of generated quiz questions and the answers they got.
+
+Every generated question is stored with the ID of the chat turn it was
+written from, and every graded answer is stored against its question, in
+the same journaled storage as the chat history (``question_bank.json``
+per learner). An in-memory index maps each source to its variants and
+each difficulty level to its questions.
+
+A quiz on a source is served from the bank, rotating through up to
+``VARIANTS_PER_SOURCE`` variants, least used first. The model is only
+asked for a new variant when every banked one has been used and the
+source has fewer than that many.
+"""
+import asyncio
+import threading
+from datetime import datetime
+
+import storage
+
+VARIANTS_PER_SOURCE = 3
+LEVELS = ["new", "easy", "medium", "hard"]
+
+
+def difficulty(scores):
+    """Level from a question's grade scores: the learner's track record on it"""
+    if not scores:
+        return "new"
+    mean = sum(scores) / len(scores)
+    if mean >= 0.8:
+        return "easy"
+    if mean >= 0.4:
+        return "medium"
+    return "hard"
+
+
+class QuestionBank(storage.HistoryIndex):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.questions = {}    # question id -> question record
+        self.by_source = {}    # source id -> question ids, oldest first
+        self.by_text = {}      # question text -> question id
+        self.by_difficulty = {level: set() for level in LEVELS}
+        self.scores = {}       # question id -> grade scores
+        self.served = {}       # question id -> times handed out by this process
+        self.synced = 0        # stored records consumed so far
+
+    def __len__(self):
+        return len(self.questions)
+
+    # ---------------- INDEX ----------------
+    def _index(self, record):
+        if "question_id" in record:
+            question_id = record["question_id"]
+            if question_id not in self.questions:
+                return
+            self.by_difficulty[self.level(question_id)].discard(question_id)
+            self.scores[question_id].append(record.get("score", 0.0))
+            self.by_difficulty[self.level(question_id)].add(question_id)
+        elif "question" in record:
+            question_id = record["id"]
+            self.questions[question_id] = record
+            self.by_source.setdefault(record["source_id"], []).append(question_id)
+            self.by_text.setdefault(record["question"], question_id)
+            self.scores[question_id] = []
+            self.by_difficulty["new"].add(question_id)
+
+    def level(self, question_id):
+        return difficulty(self.scores[question_id])
+
+    def uses(self, question_id):
+        # Answers persist across restarts; serves count the ones not answered yet
+        return max(len(self.scores[question_id]), self.served.get(question_id, 0))
+
+    # ---------------- SERVING ----------------
+    def variants(self, source_id):
+        """The banked question texts for a source, oldest first"""
+        with self.lock:
+            return [self.questions[question_id]["question"]
+                    for question_id in self.by_source.get(source_id, [])]
+
+    def pick(self, source_id):
+        """
+        The least used banked question for a source, or None when the
+        source needs a new variant.
+        """
+        with self.lock:
+            variants = self.by_source.get(source_id)
+            if not variants:
+                return None
+            question_id = min(variants, key=self.uses)
+            if self.uses(question_id) and len(variants) < VARIANTS_PER_SOURCE:
+                return None
+            self.served[question_id] = self.served.get(question_id, 0) + 1
+            return self.questions[question_id]["question"]
+
+    def _append(self, record):
+        # Re-read rather than index the record directly, so records other
+        # sessions appended meanwhile are indexed in order too
+        with self.lock:
+            storage.append_interaction(self.path, record)
+            self.refresh(self.path)
+        return record["id"]
+
+    def add(self, source_id, topic, question):
+        """Bank a newly generated question, counted as served once; a repeat is not banked again"""
+        with self.lock:
+            for question_id in self.by_source.get(source_id, []):
+                if self.questions[question_id]["question"] == question:
+                    self.served[question_id] = self.served.get(question_id, 0) + 1
+                    return question_id
+        question_id = self._append({
+            "source_id": source_id,
+            "topic": topic,
+            "question": question,
+            "time": datetime.now().isoformat()
+        })
+        with self.lock:
+            self.served[question_id] = 1
+        return question_id
+
+    def question_for(self, source_id, topic, generate):
+        """
+        A question on ``topic``: banked if possible, else ``generate(topic,
+        existing)``, where ``existing`` are the source's banked questions the
+        new one should differ from.
+        """
+        question = self.pick(source_id)
+        if question is None:
+            question = generate(topic, self.variants(source_id))
+            if question:
+                self.add(source_id, topic, question)
+        return question
+
+    async def aquestion_for(self, source_id, topic, agenerate):
+        """
+        Coroutine form of ``question_for`` for an async generator. Banking
+        takes a file lock and fsyncs, so it runs on a worker thread.
+        """
+        question = self.pick(source_id)
+        if question is None:
+            question = await agenerate(topic, self.variants(source_id))
+            if question:
+                await asyncio.to_thread(self.add, source_id, topic, question)
+        return question
+
+    def record_answer(self, question, answer, grade):
+        """Store an answer and its grade against a banked question; ignores unknown ones"""
+        with self.lock:
+            question_id = self.by_text.get(question)
+        if question_id is None:
+            return
+        self._append({
+            "question_id": question_id,
+            "answer": answer,
+            "verdict": grade["verdict"],
+            "score": grade["score"],
+            "correct": grade["correct"],
+            "time": datetime.now().isoformat()
+        })
+
+
+def variant_prompt(prompt, existing):
+    """``prompt`` asking for a question unlike the ``existing`` ones"""
+    if not existing:
+        return prompt
+    listed = "\n".join(f"- {question}" for question in existing)
+    return f"{prompt}\n\nWrite a different question from these, which were already asked:\n{listed}"
+
+
+# ---------------- PER-FILE BANKS ----------------
+_banks = storage.IndexCache(QuestionBank)
+
+
+def get_bank(path):
+    """The bank stored at ``path``, brought up to date with its newest records"""
+    return _banks.get(path)
@@ -0,0 +1,96 @@
+"""Background pre-generation of quiz questions.
+
+A ``QuizPool`` keeps a small buffer of ready questions. Refilling it picks
+sources and calls the model on worker threads, so a "Quiz me" click only
+pops a finished question off the buffer.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_SIZE = 3
+
+
+class QuizPool:
+    def __init__(self, pick_source, generate, size=POOL_SIZE, workers=2):
+        """
+        ``pick_source(exclude)`` returns a ``(key, topic)`` pair whose key is
+        not in ``exclude``, or None; ``generate(key, topic)`` returns question
+        text.
+        Both run on worker threads and must not touch ``st`` elements.
+        """
+        self.pick_source = pick_source
+        self.generate = generate
+        self.size = size
+        self.ready = {}  # key -> (topic, question), oldest first
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-pool")
+
+    def __len__(self):
+        return len(self.ready)
+
+    def refill(self):
+        """Top the buffer up in the background; returns immediately"""
+        with self.lock:
+            missing = self.size - len(self.ready) - len(self.pending)
+        for _ in range(max(0, missing)):
+            self.executor.submit(self._fill_one)
+
+    def _fill_one(self):
+        with self.lock:
+            exclude = set(self.ready) | self.pending
+        source = self.pick_source(exclude)
+        if source is None:
+            return
+        key, topic = source
+        with self.lock:
+            if key in self.ready or key in self.pending:
+                return
+            self.pending.add(key)
+        try:
+            question = self.generate(key, topic)
+        except Exception:
+            # Leave the slot empty; the next refill will try again
+            question = None
+        with self.lock:
+            self.pending.discard(key)
+            if question:
+                self.ready[key] = (topic, question)
+
+    def pop(self, key=None):
+        """
+        Take a ready question, for ``key`` if given, else the oldest one.
+        Returns ``(key, topic, question)`` or None if nothing is ready.
+        """
+        with self.lock:
+            if key is None:
+                if not self.ready:
+                    return None
+                key = next(iter(self.ready))
+            if key not in self.ready:
+                return None
+            topic, question = self.ready.pop(key)
+        return key, topic, question
+
+    async def next_ready(self, agenerate):
+        """
+        Coroutine form of ``pop`` for use alongside other calls: takes a
+        ready question, or picks a source and awaits ``agenerate(key, topic)``.
+        Picking a source reads and indexes the history, so it runs on a
+        worker thread rather than the shared event loop.
+        """
+        ready = self.pop()
+        if ready:
+            return ready
+        with self.lock:
+            exclude = set(self.ready) | self.pending
+        source = await asyncio.to_thread(self.pick_source, exclude)
+        if source is None:
+            return None
+        key, topic = source
+        return key, topic, await agenerate(key, topic)
+
+    def clear(self):
+        with self.lock:
+            self.ready.clear()
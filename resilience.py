@@ -0,0 +1,200 @@
+"""Pacing, retries and fail-fast for Gemini calls, shared by every session.
+
+Each call first takes a token from a process-wide bucket sized to the API
+quota (``GEMINI_RPM`` requests per minute), so a burst of users queues
+briefly instead of tripping 429s. Rate-limit, server and network errors
+are retried with full-jitter exponential backoff. After
+``FAILURE_THRESHOLD`` consecutive failures the circuit opens and calls
+fail at once with ``CircuitOpenError`` for ``RESET_SECONDS``; then a
+single trial call decides whether it closes again.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "60"))
+BURST = int(os.getenv("GEMINI_BURST", "10"))
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5   # Seconds before the first retry, doubled each time
+BACKOFF_CAP = 8
+MAX_QUEUE_SECONDS = 30  # Give up rather than wait longer than this for a token
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class RateLimitedError(RuntimeError):
+    pass
+
+
+def is_retryable(error):
+    """Rate limits, server errors and dropped connections; not bad requests"""
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):  # grpc-style errors expose code() instead
+        return False
+    try:
+        return int(code) in RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def backoff(attempt):
+    """Full jitter: uniform between 0 and the capped exponential delay"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token now and return how long to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > MAX_QUEUE_SECONDS:
+                raise RateLimitedError("Too many requests queued; please try again shortly.")
+            # Going negative queues later callers behind this one
+            self.tokens -= 1
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError(
+                    f"Gemini is unavailable right now; please try again in {max(1, int(remaining))}s."
+                )
+            # Half-open: let this one call through to test the API
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_running:
+                    logger.warning("Opening the Gemini circuit after %d failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+limiter = TokenBucket(REQUESTS_PER_MINUTE / 60, BURST)
+breaker = CircuitBreaker()
+
+
+def _failed(error, attempt):
+    """Record a failed attempt; True if it should be retried"""
+    if not is_retryable(error):
+        # A bad request says nothing about the API's health
+        with breaker.lock:
+            breaker.trial_running = False
+        return False
+    breaker.record_failure()
+    if attempt + 1 >= MAX_ATTEMPTS:
+        return False
+    metrics.add("retries")
+    logger.info("Retrying Gemini call after %s", error)
+    return True
+
+
+def call(fn, *args, **kwargs):
+    """``fn(*args, **kwargs)`` paced, retried and guarded by the circuit breaker"""
+    for attempt in range(MAX_ATTEMPTS):
+        breaker.before_call()
+        limiter.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not _failed(e, attempt):
+                raise
+            time.sleep(backoff(attempt))
+            continue
+        breaker.record_success()
+        return result
+
+
+async def acall(fn, *args, **kwargs):
+    """Coroutine form of ``call`` for async client methods"""
+    for attempt in range(MAX_ATTEMPTS):
+        breaker.before_call()
+        await limiter.acquire_async()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            if not _failed(e, attempt):
+                raise
+            await asyncio.sleep(backoff(attempt))
+            continue
+        breaker.record_success()
+        return result
+
+
+def stream(start):
+    """
+    Iterate the chunks of ``start()``, retrying until the first chunk
+    arrives. Once text has been shown a failure is raised, not retried.
+    """
+    def first_chunk():
+        chunks = iter(start())
+        return chunks, next(chunks, None)
+
+    chunks, first = call(first_chunk)
+    if first is None:
+        return
+    yield first
+    try:
+        yield from chunks
+    except Exception as e:
+        if is_retryable(e):
+            breaker.record_failure()
+        raise
@@ -0,0 +1,125 @@
+"""Content-addressed on-disk cache for Gemini responses.
+
+Entries are keyed on a SHA-256 of the model name, the request contents and
+the generation config, stored in a small SQLite file, expire after
+``TTL_SECONDS`` and are evicted least-recently-used once the cache grows
+past ``MAX_BYTES``.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = "llm_cache.db"
+TTL_SECONDS = 7 * 24 * 3600  # One week
+MAX_BYTES = 20 * 1024 * 1024  # 20 MB of response text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+"""
+
+
+def _canonical(value):
+    """Turn SDK request objects into plain JSON-able data"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def make_key(model, contents, config=None):
+    payload = json.dumps(
+        [model, _canonical(contents), _canonical(config)],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE, ttl=TTL_SECONDS, max_bytes=MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT text, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, text):
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode()), now, now)
+            )
+        self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop least-recently-used entries until under the size limit"""
+        (total,) = conn.execute("SELECT coalesce(sum(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        with conn:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access")
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,235 @@
+"""Incremental TF-IDF index over stored chat turns.
+
+Each history file gets one in-memory index. New records are picked up from
+the end of the history and appended to growable CSR arrays (capacity
+doubles when full), so adding a turn costs O(terms in that turn) and never
+rebuilds the index. IDF weights and row norms are recomputed lazily, with
+vectorized NumPy, the first time the index is queried after a change.
+
+The index serves three things: top-k similar past turns, near-duplicate
+collapsing, and diversity-aware sampling of quiz sources.
+"""
+import random
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+import memory
+import storage
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from how i in is it me my of on or "
+    "so that the this to was what when where which who why will with you your".split()
+)
+DUPLICATE_SIMILARITY = 0.9  # Cosine similarity above which two turns count as the same
+RELATED_TOKENS = 600        # Budget for the related turns added to a prompt
+
+
+def tokenize(text):
+    return [word for word in TOKEN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def _grow(array, needed):
+    """``array`` with capacity for ``needed`` entries, doubling as required"""
+    if needed <= len(array):
+        return array
+    capacity = len(array)
+    while capacity < needed:
+        capacity *= 2
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class TfidfIndex(storage.HistoryIndex):
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.vocab = {}                              # term -> column
+        self.df = np.zeros(256, dtype=np.int64)      # documents per column
+        self.indptr = np.zeros(65, dtype=np.int64)   # CSR row starts
+        self.indices = np.zeros(1024, dtype=np.int32)
+        self.counts = np.zeros(1024, dtype=np.float64)
+        self.nnz = 0
+        self.ids = []
+        self.rows = {}       # item id -> row
+        self.queries = []
+        self.responses = []
+        self.groups = {}     # normalized query terms -> rows with that query
+        self.synced = 0      # history records consumed so far
+        self._matrix = None  # (normalized rows, idf), dropped on every add
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------------- UPDATES ----------------
+    def add(self, item_id, query, response=""):
+        terms = Counter(tokenize(f"{query} {response}"))
+        group_key = " ".join(sorted(set(tokenize(query)))) or query.strip().lower()
+        with self.lock:
+            columns = []
+            for term in terms:
+                column = self.vocab.get(term)
+                if column is None:
+                    column = self.vocab[term] = len(self.vocab)
+                columns.append(column)
+            row = len(self.ids)
+            end = self.nnz + len(columns)
+            self.df = _grow(self.df, len(self.vocab))
+            self.indptr = _grow(self.indptr, row + 2)
+            self.indices = _grow(self.indices, end)
+            self.counts = _grow(self.counts, end)
+
+            self.indices[self.nnz:end] = columns
+            self.counts[self.nnz:end] = list(terms.values())
+            self.df[columns] += 1
+            self.nnz = end
+            self.indptr[row + 1] = end
+
+            self.ids.append(item_id)
+            self.rows[item_id] = row
+            self.queries.append(query)
+            self.responses.append(response)
+            self.groups.setdefault(group_key, []).append(row)
+            self._matrix = None
+
+    def _index(self, item):
+        if "query" in item:
+            self.add(item["id"], item["query"], item.get("response") or "")
+
+    # ---------------- QUERIES ----------------
+    def _weights(self):
+        with self.lock:
+            if self._matrix is None:
+                rows, columns = len(self.ids), len(self.vocab)
+                idf = np.log((1 + rows) / (1 + self.df[:columns])) + 1
+                indices = self.indices[:self.nnz]
+                data = (1 + np.log(self.counts[:self.nnz])) * idf[indices]
+                matrix = sparse.csr_matrix(
+                    (data, indices.copy(), self.indptr[:rows + 1].copy()),
+                    shape=(rows, columns)
+                )
+                norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+                norms[norms == 0] = 1
+                self._matrix = (sparse.diags(1 / norms) @ matrix).tocsr(), idf
+            return self._matrix
+
+    def _vector(self, text, idf):
+        terms = Counter(term for term in tokenize(text) if term in self.vocab)
+        if not terms:
+            return None
+        columns = [self.vocab[term] for term in terms]
+        data = (1 + np.log(np.fromiter(terms.values(), dtype=np.float64))) * idf[columns]
+        data /= np.linalg.norm(data)
+        return sparse.csr_matrix(
+            (data, columns, [0, len(columns)]), shape=(1, len(idf))
+        )
+
+    def search(self, text, k=5, exclude=(), collapse=True):
+        """
+        The ``k`` most similar turns as ``(row, score)`` pairs, best first.
+        With ``collapse``, a result too close to a better one is skipped.
+        """
+        with self.lock:
+            if not self.ids:
+                return []
+            matrix, idf = self._weights()
+            query = self._vector(text, idf)
+        if query is None:
+            return []
+        scores = (matrix @ query.T).toarray().ravel()
+        for row in exclude:
+            scores[row] = 0
+        candidates = min(len(scores), k * 3 if collapse else k)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            if scores[row] <= 0 or len(results) == k:
+                break
+            if collapse and results:
+                kept = [r for r, _ in results]
+                if (matrix[kept] @ matrix[row].T).max() >= DUPLICATE_SIMILARITY:
+                    continue
+            results.append((int(row), float(scores[row])))
+        return results
+
+    def sample(self, avoid=(), rng=random):
+        """
+        A random row for a quiz source. Each group of repeated questions
+        counts once, and rows close to any row in ``avoid`` are passed over
+        unless nothing else is left.
+        """
+        with self.lock:
+            if not self.ids:
+                return None
+            groups = list(self.groups.values())
+            avoid = [row for row in avoid if row < len(self.ids)]
+            if avoid:
+                matrix, _ = self._weights()
+                closeness = (matrix @ matrix[avoid].T).max(axis=1).toarray().ravel()
+                fresh = [rows for rows in groups if closeness[rows[-1]] < DUPLICATE_SIMILARITY]
+                groups = fresh or groups
+            return rng.choice(rng.choice(groups))
+
+
+# ---------------- PER-FILE INDEXES ----------------
+_indexes = storage.IndexCache(lambda path: TfidfIndex())
+
+
+def get_index(path):
+    """The index for a history file, brought up to date with its newest records"""
+    return _indexes.get(path)
+
+
+def similar(path, text, k=5):
+    """Past turns most similar to ``text``, near-duplicates collapsed"""
+    index = get_index(path)
+    return [
+        {"id": index.ids[row], "query": index.queries[row],
+         "response": index.responses[row], "score": score}
+        for row, score in index.search(text, k)
+    ]
+
+
+def sample_source(path, avoid_ids=()):
+    """``(id, query)`` of a quiz source unlike those in ``avoid_ids``, or None"""
+    index = get_index(path)
+    with index.lock:
+        row = index.sample([index.rows[item_id] for item_id in avoid_ids if item_id in index.rows])
+        if row is None:
+            return None
+        return index.ids[row], index.queries[row]
+
+
+def _trim(text, tokens):
+    limit = tokens * 4  # ``memory.estimate_tokens`` counts ~4 characters per token
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def related_context(path, text, k=3, max_tokens=RELATED_TOKENS):
+    """
+    Related past answers formatted for a prompt, or "" when there are none.
+    Each turn is cut to an equal share of ``max_tokens``, best match first,
+    and turns stop once the budget is spent.
+    """
+    matches = similar(path, text, k)
+    if not matches:
+        return ""
+    share = max_tokens // len(matches)
+    lines, used = [], 0
+    for item in matches:
+        line = f"Q: {_trim(item['query'], share // 4)}\nA: {_trim(item['response'], share * 3 // 4)}"
+        tokens = memory.estimate_tokens(line)
+        if lines and used + tokens > max_tokens:
+            break
+        lines.append(line)
+        used += tokens
+    return "Related earlier conversations:\n\n" + "\n\n".join(lines)
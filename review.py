@@ -0,0 +1,117 @@
+"""Review sessions: many quiz questions or grades per model call.
+
+Instead of one round trip per card to write its question and another to
+grade the answer, a session asks for every question in one structured
+(JSON) call and grades all the answers in another. Items are matched back
+to cards by ID, so a reply that skips or reorders items still lines up.
+"""
+import json
+import logging
+
+from google.genai import types
+
+import grading
+import llm
+import question_bank
+
+logger = logging.getLogger(__name__)
+
+SESSION_SIZE = 10  # Cards per review session
+
+QUESTIONS_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "id": types.Schema(type=types.Type.STRING),
+            "question": types.Schema(type=types.Type.STRING)
+        },
+        required=["id", "question"]
+    )
+)
+
+GRADES_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties=dict(id=types.Schema(type=types.Type.STRING), **grading.GRADE_PROPERTIES),
+        required=["id", "verdict", "score", "feedback"]
+    )
+)
+
+
+def _parse_items(text):
+    """The JSON array from a structured reply, keyed by item ID"""
+    try:
+        items = json.loads(text or "[]")
+    except json.JSONDecodeError:
+        logger.warning("Could not parse batch reply: %.200s", text)
+        return {}
+    if not isinstance(items, list):
+        return {}
+    return {str(item["id"]): item for item in items if isinstance(item, dict) and "id" in item}
+
+
+def generate_questions(client, model, cards, existing=None):
+    """
+    One short question per card, in a single call. ``cards`` are
+    ``(id, topic)`` pairs and ``existing`` maps a card ID to its banked
+    questions, which the new one must differ from; returns
+    ``{id: question}`` for the cards the model answered.
+    """
+    if not cards:
+        return {}
+    existing = existing or {}
+    listing = "\n".join(
+        question_bank.variant_prompt(f"- id: {card_id}\n  topic: {topic}", existing.get(card_id))
+        for card_id, topic in cards
+    )
+    prompt = (
+        "Create one short conceptual quiz question for each topic below. "
+        "Do NOT give the answers. Return one item per topic with its id.\n\n"
+        f"{listing}"
+    )
+    # Only a batch of first questions may come from the cache
+    text = llm.generate_text(
+        client, model, llm.user_content(prompt), llm.json_config(QUESTIONS_SCHEMA),
+        cache=not any(existing.values()), site="quiz-gen"
+    )
+    items = _parse_items(text)
+    return {
+        card_id: items[card_id]["question"]
+        for card_id, _ in cards
+        if card_id in items and items[card_id].get("question")
+    }
+
+
+def grade_answers(client, model, answers):
+    """
+    Grade a batch of answers in a single call. ``answers`` are dicts with
+    ``id``, ``topic``, ``question`` and ``answer``; returns
+    ``{id: grade}`` for the graded items, each grade as from
+    ``grading.parse_grade``.
+    """
+    if not answers:
+        return {}
+    listing = "\n\n".join(
+        f"id: {item['id']}\n"
+        f"Topic: {item['topic']}\n"
+        f"Question: {item['question']}\n"
+        f"Student Answer: {item['answer'] or '(no answer)'}"
+        for item in answers
+    )
+    prompt = (
+        "You are an examiner. Decide whether each student answer below is correct. "
+        f"{grading.INSTRUCTIONS} Return one item per answer with its id.\n\n"
+        f"{listing}"
+    )
+    text = llm.generate_text(
+        client, model, llm.user_content(prompt), llm.json_config(GRADES_SCHEMA), cache=False,
+        site="grading"
+    )
+    items = _parse_items(text)
+    return {
+        item["id"]: grading.from_item(items[item["id"]])
+        for item in answers
+        if item["id"] in items
+    }
@@ -0,0 +1,328 @@
+"""Spaced-repetition scheduling for spacedrep cards.
+
+A scheduler turns a graded review into the card's next interval:
+
+- ``FixedIntervals``: the original four steps by level (10 min to 3 days)
+- ``SM2``: SuperMemo-2, a per-card ease factor multiplying the interval
+- ``FSRS``: FSRS-4.5, per-card stability and difficulty; the interval is
+  the time until recall probability drops to ``DESIRED_RETENTION``
+
+Intervals keep growing with every successful review, so each mature card
+comes back less and less often and the daily workload stays bounded as the
+deck grows. Due dates for the whole deck are computed at once with NumPy
+(``due_times``), e.g. after changing the desired retention.
+
+Cards are kept in a min-heap keyed on their next-due timestamp, so finding
+the next due card, listing everything due and rescheduling after an answer
+are all O(log n) instead of a walk over the whole history. Rescheduling
+pushes a fresh heap entry and leaves the old one to be skipped lazily.
+Each history file's queue follows the stored history (``get_due_queue``):
+appended and updated cards are picked up from storage's changes, and the
+queue starts over when the history is rewritten.
+"""
+import heapq
+import math
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import storage
+
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+
+LEGACY_DAYS = [10 / 1440, 1 / 24, 1, 3]  # The original steps for levels 0-3
+RELEARN_DAYS = 10 / 1440                  # A missed card comes back after 10 minutes
+MAX_INTERVAL_DAYS = 365
+DESIRED_RETENTION = float(os.getenv("SPACEDREP_RETENTION", "0.9"))
+
+
+def rating(grade):
+    """The review rating for a grade from ``grading``"""
+    if not grade["correct"]:
+        return AGAIN
+    return HARD if grade["verdict"] == "partially_correct" else GOOD
+
+
+def _field(cards, name, default):
+    return np.array([card.get(name, default) for card in cards], dtype=np.float64)
+
+
+def _legacy_days(cards):
+    levels = np.array([min(int(card.get("level", 0)), 3) for card in cards], dtype=np.int64)
+    return np.take(LEGACY_DAYS, levels)
+
+
+class FixedIntervals:
+    """The original level-based steps, for histories that want them"""
+    def intervals(self, cards):
+        return _legacy_days(cards)
+
+    def review(self, card, grade_rating, now):
+        level = min(card.get("level", 0) + 1, 3) if grade_rating != AGAIN else 0
+        return {"level": level, "interval": LEGACY_DAYS[level]}
+
+
+class SM2:
+    INITIAL_EASE = 2.5
+    MIN_EASE = 1.3
+    QUALITY = {AGAIN: 2, HARD: 3, GOOD: 4, EASY: 5}  # SM-2 answer quality, 0-5
+
+    def intervals(self, cards):
+        stored = _field(cards, "interval", np.nan)
+        days = np.where(np.isnan(stored), _legacy_days(cards), stored)
+        lapsed = _field(cards, "lapsed", False).astype(bool)
+        return np.where(lapsed, RELEARN_DAYS, days)
+
+    def review(self, card, grade_rating, now):
+        quality = self.QUALITY[grade_rating]
+        ease = card.get("ease", self.INITIAL_EASE)
+        ease = max(self.MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        if grade_rating == AGAIN:
+            return {"level": 0, "ease": ease, "reps": 0, "interval": 1, "lapsed": True}
+
+        reps = card.get("reps", card.get("level", 0)) + 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            previous = card.get("interval", LEGACY_DAYS[min(card.get("level", 0), 3)])
+            interval = previous * ease
+        interval = min(MAX_INTERVAL_DAYS, interval)
+        return {"level": reps, "ease": ease, "reps": reps, "interval": interval, "lapsed": False}
+
+
+class FSRS:
+    # FSRS-4.5 default parameters
+    W = [0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+         0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755]
+    DECAY = -0.5
+    FACTOR = 19 / 81
+
+    def __init__(self, desired_retention=DESIRED_RETENTION):
+        self.desired_retention = desired_retention
+
+    def interval_for(self, stability):
+        """Days until recall probability falls to the desired retention (works on arrays)"""
+        days = stability / self.FACTOR * (self.desired_retention ** (1 / self.DECAY) - 1)
+        return np.clip(days, RELEARN_DAYS, MAX_INTERVAL_DAYS)
+
+    def intervals(self, cards):
+        # At the default 0.9 retention an interval equals the stability, so
+        # cards from before FSRS start from their old step
+        stability = _field(cards, "stability", np.nan)
+        stability = np.where(np.isnan(stability), _legacy_days(cards), stability)
+        lapsed = _field(cards, "lapsed", False).astype(bool)
+        return np.where(lapsed, RELEARN_DAYS, self.interval_for(stability))
+
+    def retrievability(self, elapsed_days, stability):
+        return (1 + self.FACTOR * elapsed_days / stability) ** self.DECAY
+
+    def _initial_difficulty(self, grade_rating):
+        w = self.W
+        return min(10.0, max(1.0, w[4] - (grade_rating - 3) * w[5]))
+
+    def review(self, card, grade_rating, now):
+        w = self.W
+        stability = card.get("stability")
+        if stability is None and card.get("level", 0) == 0:
+            # First review: the initial state comes from the rating alone
+            stability = w[grade_rating - 1]
+            difficulty = self._initial_difficulty(grade_rating)
+        else:
+            # A card reviewed before FSRS starts from its old step
+            if stability is None:
+                stability = LEGACY_DAYS[min(card["level"], 3)]
+            difficulty = card.get("difficulty", self._initial_difficulty(GOOD))
+            elapsed = (now - datetime.fromisoformat(card["last_reviewed"])).total_seconds() / 86400
+            recall = self.retrievability(max(0.0, elapsed), stability)
+            # Both stability formulas use the difficulty from before this review
+            if grade_rating == AGAIN:
+                stability = (w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+                             * math.exp(w[14] * (1 - recall)))
+            else:
+                hard_penalty = w[15] if grade_rating == HARD else 1
+                easy_bonus = w[16] if grade_rating == EASY else 1
+                stability = stability * (
+                    math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                    * (math.exp(w[10] * (1 - recall)) - 1) * hard_penalty * easy_bonus + 1
+                )
+            difficulty = difficulty - w[6] * (grade_rating - 3)
+            difficulty = w[7] * self._initial_difficulty(GOOD) + (1 - w[7]) * difficulty
+            difficulty = min(10.0, max(1.0, difficulty))
+
+        lapsed = grade_rating == AGAIN
+        level = 0 if lapsed else card.get("level", 0) + 1
+        return {
+            "level": level,
+            "stability": stability,
+            "difficulty": difficulty,
+            "interval": float(self.interval_for(stability)),
+            "lapsed": lapsed
+        }
+
+
+SCHEDULERS = {"fixed": FixedIntervals, "sm2": SM2, "fsrs": FSRS}
+
+
+def get_scheduler(name=None):
+    """The scheduler named by ``name`` or ``SPACEDREP_SCHEDULER`` (default fsrs)"""
+    name = (name or os.getenv("SPACEDREP_SCHEDULER", "fsrs")).lower()
+    return SCHEDULERS[name]()
+
+
+def due_times(scheduler, cards):
+    """Next-due datetimes for ``cards``, computed for the whole list at once"""
+    if not cards:
+        return []
+    last = np.array([card["last_reviewed"] for card in cards], dtype="datetime64[us]")
+    offsets = (scheduler.intervals(cards) * 86400e6).astype("timedelta64[us]")
+    return (last + offsets).tolist()
+
+
+def _is_card(item):
+    return "last_reviewed" in item and "level" in item
+
+
+class DueQueue(storage.HistoryIndex):
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.cards = {}   # id -> card record
+        self.due = {}     # id -> current due datetime
+        self.heap = []    # (due, id), may hold stale entries
+        self.synced = 0
+
+    def __len__(self):
+        return len(self.cards)
+
+    # ---------------- HISTORY SYNC ----------------
+    def _index(self, item):
+        if _is_card(item):
+            self._push(item)
+
+    def _index_many(self, items):
+        cards = [item for item in items if _is_card(item)]
+        if len(cards) < 2:
+            for card in cards:
+                self._push(card)
+            return
+        # Due dates for a batch (the whole history after a reset) in one NumPy pass
+        for card, due in zip(cards, due_times(self.scheduler, cards)):
+            self.cards[card["id"]] = card
+            self.due[card["id"]] = due
+            self.heap.append((due, card["id"]))
+        heapq.heapify(self.heap)
+
+    def _update(self, item):
+        if _is_card(item):
+            self._push(item)
+        else:
+            self.remove(item["id"])
+
+    def _update_all(self, items):
+        self.load(items)
+
+    def due_time(self, card):
+        return due_times(self.scheduler, [card])[0]
+
+    def load(self, items):
+        """Build the heap from stored records in O(n)"""
+        with self.lock:
+            cards = [item for item in items if _is_card(item)]
+            self.cards = {card["id"]: card for card in cards}
+            self.due = dict(zip(self.cards, due_times(self.scheduler, list(self.cards.values()))))
+            self.heap = [(due, item_id) for item_id, due in self.due.items()]
+            heapq.heapify(self.heap)
+
+    def add(self, card):
+        with self.lock:
+            self._push(card)
+
+    def _push(self, card):
+        due = self.due_time(card)
+        self.cards[card["id"]] = card
+        self.due[card["id"]] = due
+        heapq.heappush(self.heap, (due, card["id"]))
+
+    def _drop_stale(self):
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_due(self, now=None):
+        """The most overdue card, or None if nothing is due yet"""
+        now = now or datetime.now()
+        with self.lock:
+            self._drop_stale()
+            if self.heap and self.heap[0][0] <= now:
+                return self.cards[self.heap[0][1]]
+            return None
+
+    def all_due(self, now=None):
+        """Every card due at ``now``, most overdue first"""
+        now = now or datetime.now()
+        with self.lock:
+            popped, seen = [], set()
+            while self.heap:
+                self._drop_stale()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                entry = heapq.heappop(self.heap)
+                if entry[1] not in seen:
+                    seen.add(entry[1])
+                    popped.append(entry)
+            for entry in popped:
+                heapq.heappush(self.heap, entry)
+            return [self.cards[item_id] for _, item_id in popped]
+
+    def review_fields(self, item_id, grade, now=None):
+        """The fields to store for a graded review of a card, or None if unknown"""
+        now = now or datetime.now()
+        with self.lock:
+            card = self.cards.get(item_id)
+            if card is None:
+                return None
+            fields = self.scheduler.review(card, rating(grade), now)
+        fields["last_reviewed"] = now.isoformat()
+        return fields
+
+    def reschedule(self, item_id, fields):
+        """Apply a review result (new state / last_reviewed) to a card"""
+        with self.lock:
+            card = self.cards.get(item_id)
+            if card is None:
+                return None
+            card.update(fields)
+            self._push(card)
+            return card
+
+    def forecast(self, days=14, now=None):
+        """Reviews due on each of the next ``days`` days; overdue cards count today"""
+        now = now or datetime.now()
+        with self.lock:
+            dates = np.fromiter((due.toordinal() for due in self.due.values()), np.int64, len(self.due))
+        offsets = np.maximum(0, dates - now.toordinal())
+        return np.bincount(offsets[offsets < days], minlength=days)
+
+    def remove(self, item_id):
+        with self.lock:
+            self.cards.pop(item_id, None)
+            self.due.pop(item_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.cards, self.due, self.heap = {}, {}, []
+
+
+# ---------------- PER-FILE QUEUES ----------------
+_queues = storage.IndexCache(lambda path: DueQueue(get_scheduler()))
+
+
+def get_due_queue(path):
+    """The due queue for a history file, brought up to date with its stored cards"""
+    return _queues.get(path)
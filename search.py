@@ -0,0 +1,205 @@
+"""Full-text search over stored chat turns.
+
+Each history file gets one in-memory inverted index: a postings list per
+term (document numbers and term counts in compact arrays) plus a sorted
+vocabulary for prefix matching. New records are picked up from the end of
+the history, so adding a turn costs O(terms in that turn). A query scores
+only the postings of its terms, with BM25, using vectorized NumPy.
+
+The last word of a query also matches as a prefix ("recurs" finds
+"recursion"), so results show up before a word is typed out.
+"""
+import bisect
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+import retrieval
+import storage
+
+TEXT_FIELDS = ["query", "response", "content"]
+FILTER_FIELDS = ["query", "role"]  # Fields a search can be limited to
+WORD = re.compile(r"[a-z0-9]+", re.IGNORECASE)
+
+K1 = 1.2   # BM25 term-frequency saturation
+B = 0.75   # BM25 length normalization
+MIN_PREFIX = 2        # Shorter trailing words only match exactly
+MAX_EXPANSIONS = 50   # Most frequent completions used for a prefix
+SNIPPET_WORDS = 30
+
+
+def tokenize(text):
+    return retrieval.tokenize(text)
+
+
+class SearchIndex(storage.HistoryIndex):
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.postings = {}     # term -> (document numbers, counts)
+        self.terms = []        # vocabulary, sorted, for prefix lookups
+        self.lengths = array("i")
+        self.total_length = 0
+        self.ids = []
+        self.field_docs = {field: array("i") for field in FILTER_FIELDS}
+        self.synced = 0        # history records consumed so far
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------------- UPDATES ----------------
+    def add(self, item):
+        words = tokenize(" ".join(str(item[field]) for field in TEXT_FIELDS if item.get(field)))
+        with self.lock:
+            doc = len(self.ids)
+            for term, count in Counter(words).items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("i"), array("i"))
+                    bisect.insort(self.terms, term)
+                entry[0].append(doc)
+                entry[1].append(count)
+            for field, docs in self.field_docs.items():
+                if field in item:
+                    docs.append(doc)
+            self.lengths.append(len(words))
+            self.total_length += len(words)
+            self.ids.append(item["id"])
+
+    def _index(self, item):
+        if any(item.get(field) for field in TEXT_FIELDS):
+            self.add(item)
+
+    # ---------------- QUERIES ----------------
+    def expand(self, word):
+        """Indexed terms starting with ``word``, most frequent first"""
+        start = bisect.bisect_left(self.terms, word)
+        end = bisect.bisect_left(self.terms, word + "\uffff")
+        matches = self.terms[start:end]
+        if len(matches) > MAX_EXPANSIONS:
+            matches.sort(key=lambda term: len(self.postings[term][0]), reverse=True)
+            matches = matches[:MAX_EXPANSIONS]
+        return matches
+
+    def query_terms(self, text):
+        """
+        The indexed terms a query matches, one group per query word. The
+        last word also matches as a prefix unless the query ends in a space.
+        """
+        words = tokenize(text)
+        typed = WORD.findall(text)
+        prefix = typed[-1].lower() if typed and text[-1:].isalnum() else None
+        if prefix is not None and len(prefix) < MIN_PREFIX:
+            prefix = None
+        groups = []
+        for word in dict.fromkeys(words):
+            if word == prefix:
+                group = self.expand(word)
+            else:
+                group = [word] if word in self.postings else []
+            if group:
+                groups.append(group)
+        return groups
+
+    def search(self, text, k=10, field=None):
+        """
+        The ``k`` best matches as ``(id, score, terms)`` tuples, best first,
+        where ``terms`` are the indexed terms that matched (for snippets).
+        """
+        with self.lock:
+            count = len(self.ids)
+            if not count:
+                return []
+            groups = self.query_terms(text)
+            if not groups:
+                return []
+            lengths = np.array(self.lengths[:count], dtype=np.float64)
+            norm = K1 * (1 - B + B * lengths / max(1.0, self.total_length / count))
+            scores = np.zeros(count)
+            for group in groups:
+                for term in group:
+                    docs, counts = self.postings[term]
+                    docs = np.array(docs, dtype=np.int32)
+                    tf = np.array(counts, dtype=np.float64)
+                    idf = np.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    # A postings list names each document once, so += is safe
+                    scores[docs] += idf * tf * (K1 + 1) / (tf + norm[docs])
+            if field is not None:
+                allowed = np.zeros(count, dtype=bool)
+                allowed[np.array(self.field_docs[field], dtype=np.int32)] = True
+                scores[~allowed] = 0
+            ids = self.ids
+            matched = [term for group in groups for term in group]
+
+        hits = int(np.count_nonzero(scores))
+        if not hits:
+            return []
+        k = min(k, hits)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(ids[doc], float(scores[doc]), matched) for doc in top]
+
+
+# ---------------- SNIPPETS ----------------
+def snippet(text, terms, words=SNIPPET_WORDS):
+    """
+    The ``words``-long stretch of ``text`` with the most matched terms, as
+    markdown with the matches in bold. Short text is returned whole.
+    """
+    text = " ".join(str(text).split())
+    terms = set(terms)
+    spans = list(WORD.finditer(text))
+    hits = [n for n, span in enumerate(spans) if span.group().lower() in terms]
+    start = 0
+    if len(spans) > words and hits:
+        # Slide a window over the hit positions and keep the densest one
+        best = 0
+        for first, position in enumerate(hits):
+            covered = bisect.bisect_left(hits, position + words, first) - first
+            if covered > best:
+                best, start = covered, max(0, min(position - 2, len(spans) - words))
+    end = min(len(spans), start + words)
+
+    begin = spans[start].start() if start and spans else 0
+    finish = spans[end - 1].end() if end < len(spans) else len(text)
+    pieces, position = [], begin
+    for span in spans[start:end]:
+        if span.group().lower() in terms:
+            pieces.append(_escape(text[position:span.start()]))
+            pieces.append(f"**{span.group()}**")
+            position = span.end()
+    pieces.append(_escape(text[position:finish]))
+    return ("…" if begin else "") + "".join(pieces) + ("…" if finish < len(text) else "")
+
+
+def _escape(text):
+    """Keep stored text from opening markdown or HTML of its own"""
+    return re.sub(r"([\\`*_\[\]#<>|~])", r"\\\1", text)
+
+
+# ---------------- PER-FILE INDEXES ----------------
+_indexes = storage.IndexCache(lambda path: SearchIndex())
+
+
+def get_index(path):
+    """The index for a history file, brought up to date with its newest records"""
+    return _indexes.get(path)
+
+
+def search(path, text, k=10, field=None):
+    """
+    Ranked matches for ``text`` in a history file, limited to records that
+    have ``field`` when given. Each result is ``(item, terms)``; pass the
+    text to show and ``terms`` to ``snippet``.
+    """
+    results = []
+    for item_id, _, terms in get_index(path).search(text, k, field):
+        item = storage.get_interaction(path, item_id)
+        if item is not None:
+            results.append((item, terms))
+    return results
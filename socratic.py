@@ -1,18 +1,21 @@
 import streamlit as st
 import google.generativeai as genai
 from dotenv import load_dotenv
-import json
 import os
 from datetime import datetime
 
+import history_browser
+import llm
+import memory
+import metrics
+import storage
+import users
+
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="SocraticBot", layout="centered")
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.5-flash-lite")
-
-DATA_FILE = "chat_history.json"
+DATA_FILE = storage.user_path("chat_history.json", users.current_user_id())
 
 # ---------------- SOCRATIC SYSTEM PROMPT ----------------
 SOCRATIC_PROMPT = """You are a Socratic tutor. Your primary method is asking questions, not giving answers.
@@ -33,19 +36,42 @@ You: "Good start! So if plants use sunlight for energy, what do you think they m
 
 Keep responses SHORT (2-3 sentences max). Be genuinely curious about their thinking."""
 
+# The tutor prompt is sent once as the system instruction, not with every turn
+model = llm.get_generative_model(
+    os.getenv("GEMINI_API_KEY"),
+    "gemini-2.5-flash-lite",
+    system_instruction=SOCRATIC_PROMPT
+)
+
+# Plain model (no tutor prompt) used to summarize older turns
+summary_model = llm.get_generative_model(os.getenv("GEMINI_API_KEY"), "gemini-2.5-flash-lite")
+
+GENERATION_CONFIG = genai.types.GenerationConfig(
+    temperature=0.7,
+    max_output_tokens=200,  # Force short responses
+)
+HISTORY_WINDOW = 20  # Messages (10 exchanges) loaded from disk to seed the memory
+
 # ---------------- JSON HELPERS ----------------
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"interactions": []}
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return {"interactions": []}
+    return storage.load_data(DATA_FILE)
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    storage.save_data(DATA_FILE, data)
+
+def save_message(role, content):
+    storage.append_interaction(DATA_FILE, {
+        "role": role,
+        "content": content,
+        "time": datetime.now().isoformat()
+    })
+
+def format_history_item(item, shorten):
+    role_emoji = "👤" if item["role"] == "user" else "🤖"
+    return (
+        f"{role_emoji} **{item['role'].title()}:** {shorten(item['content'])}\n\n"
+        f"⏱️ {item['time']}\n---"
+    )
 
 def build_messages_for_gemini():
     """
@@ -54,8 +80,8 @@ def build_messages_for_gemini():
     data = load_data()
     messages = []
     
-    # Get last 20 interactions (10 exchanges)
-    recent = data["interactions"][-20:]
+    # Get last 20 messages (10 exchanges)
+    recent = [item for item in data["interactions"] if "role" in item][-HISTORY_WINDOW:]
     
     for item in recent:
         role = "user" if item["role"] == "user" else "model"
@@ -74,6 +100,14 @@ st.caption("Learning through questions, not answers")
 if "chat" not in st.session_state:
     st.session_state.chat = []
 
+# One chat session per browser session, seeded from disk only once
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
+    for message in build_messages_for_gemini():
+        st.session_state.memory.add(message["role"], message["parts"][0])
+if "tutor_chat" not in st.session_state:
+    st.session_state.tutor_chat = model.start_chat(history=[])
+
 # Display chat history
 for msg in st.session_state.chat:
     with st.chat_message(msg["role"]):
@@ -89,58 +123,46 @@ if user_input:
     st.session_state.chat.append({"role": "user", "content": user_input})
     
     # Save user message to history
-    data = load_data()
-    data["interactions"].append({
-        "role": "user",
-        "content": user_input,
-        "time": datetime.now().isoformat()
-    })
-    save_data(data)
-    
-    # Build conversation with system prompt
-    messages = build_messages_for_gemini()
+    save_message("user", user_input)
     
-    # Create chat with system instruction
-    chat = model.start_chat(
-        history=messages
-    )
-    
-    # Generate response with system instruction as first message
-    response = chat.send_message(
-        f"{SOCRATIC_PROMPT}\n\nRespond to: {user_input}",
-        generation_config=genai.types.GenerationConfig(
-            temperature=0.7,
-            max_output_tokens=200,  # Force short responses
-        )
-    )
+    # Send the running summary plus the recent turns that fit the token budget
+    tutor_chat = st.session_state.tutor_chat
+    tutor_chat.history = [
+        {"role": role, "parts": [text]} for role, text in st.session_state.memory.messages()
+    ]
     
-    reply = response.text.strip()
+    try:
+        with st.chat_message("assistant"):
+            reply = st.write_stream(llm.stream_chat(
+                tutor_chat,
+                user_input,
+                generation_config=GENERATION_CONFIG
+            )).strip()
     
-    # Display and save assistant response
-    with st.chat_message("assistant"):
-        st.markdown(reply)
-    st.session_state.chat.append({"role": "assistant", "content": reply})
+        # Save assistant response
+        st.session_state.chat.append({"role": "assistant", "content": reply})
     
-    data["interactions"].append({
-        "role": "assistant",
-        "content": reply,
-        "time": datetime.now().isoformat()
-    })
-    save_data(data)
+        save_message("assistant", reply)
+        st.session_state.memory.record_turn(
+            user_input, reply,
+            llm.model_summarizer(summary_model)
+        )
+    except Exception as e:
+        st.error(f"Error: {e}")
 
 # ---------------- SIDEBAR ----------------
 with st.sidebar:
     st.header("📜 Conversation History")
     
-    if st.button("🔄 Load Full History"):
-        data = load_data()
-        for item in data["interactions"]:
-            role_emoji = "👤" if item["role"] == "user" else "🤖"
-            st.markdown(f"{role_emoji} **{item['role'].title()}:** {item['content']}")
-            st.caption(f"⏱️ {item['time']}")
-            st.divider()
+    if st.toggle("🔄 Load Full History"):
+        history_browser.render_history(DATA_FILE, "history_page", format_history_item, field="role")
     
     if st.button("🗑️ Clear History"):
         save_data({"interactions": []})
         st.session_state.chat = []
-        st.rerun()
\ No newline at end of file
+        st.session_state.tutor_chat = model.start_chat(history=[])
+        st.session_state.memory.clear()
+        st.rerun()
+
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
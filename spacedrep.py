@@ -1,76 +1,103 @@
 import streamlit as st
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-import json
+import functools
 import os
 from datetime import datetime
 
+import grading
+import history_browser
+import llm
+import memory
+import metrics
+import question_bank
+import quiz_pool
+import review
+import scheduler
+import storage
+import users
+
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="SpacedRep", layout="centered")
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = llm.get_client(os.getenv("GEMINI_API_KEY"))
 MODEL_NAME = "gemini-2.5-flash-lite"
-DATA_FILE = "chat_history.json"
+DATA_FILE = storage.user_path("chat_history.json", users.current_user_id())
+BANK_FILE = storage.user_path("question_bank.json", users.current_user_id())
 
 # ---------------- JSON HELPERS ----------------
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"interactions": []}
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return {"interactions": []}
+    return storage.load_data(DATA_FILE)
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    storage.save_data(DATA_FILE, data)
 
 def save_interaction(query, response):
-    data = load_data()
-    data["interactions"].append({
+    item = {
         "query": query,
         "response": response,
         "level": 0,
         "last_reviewed": datetime.now().isoformat()
-    })
-    save_data(data)
+    }
+    storage.append_interaction(DATA_FILE, item)
+
+def format_history_item(item, shorten):
+    return (
+        f"**Q:** {shorten(item['query'])}\n\n"
+        f"**A:** {shorten(item['response'])}\n\n"
+        f"**Level:** {item.get('level', 0)}\n"
+        f"⏱ {item.get('last_reviewed', item.get('time', ''))}\n---"
+    )
 
 # ---------------- SPACED REPETITION LOGIC ----------------
-def get_interval_minutes(level):
-    if level == 0:
-        return 10
-    elif level == 1:
-        return 60
-    elif level == 2:
-        return 1440        # 1 day
-    else:
-        return 4320        # 3 days
+FORECAST_DAYS = 14
+
+def get_due_queue(data_file):
+    """Due-date heap for one history file, following its stored cards"""
+    return scheduler.get_due_queue(data_file)
 
 def get_due_question():
-    data = load_data()
-    now = datetime.now()
-
-    for item in data["interactions"]:
-        last = datetime.fromisoformat(item["last_reviewed"])
-        interval = get_interval_minutes(item["level"])
-        if (now - last).total_seconds() >= interval * 60:
-            return item
+    return get_due_queue(DATA_FILE).next_due()
+
+def review_card(item_id, grade):
+    """Schedule a card's next review from its grade (SM-2 / FSRS state and due date)"""
+    queue = get_due_queue(DATA_FILE)
+    fields = queue.review_fields(item_id, grade)
+    if fields is None:
+        return
+    storage.update_interaction(DATA_FILE, item_id, fields)
+    queue.reschedule(item_id, fields)
+
+# ---------------- QUIZ PRE-GENERATION ----------------
+def build_quiz_prompt(topic):
+    return (
+        "Create a short conceptual quiz question based on the following topic. "
+        "Do NOT give the answer.\n\n"
+        f"Topic: {topic}"
+    )
+
+def generate_quiz_question(topic, existing=()):
+    # A variant must differ from the banked ones, so only a first question is cached
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return llm.generate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
+
+def quiz_question(source_id, topic):
+    """A banked question for this source, generated only when its bank runs dry"""
+    return question_bank.get_bank(BANK_FILE).question_for(source_id, topic, generate_quiz_question)
+
+def pick_quiz_source(data_file, exclude):
+    """The most overdue card that has no question buffered yet"""
+    for card in get_due_queue(data_file).all_due():
+        if card["id"] not in exclude:
+            return card["id"], card["query"]
     return None
 
-def update_level(question, correct):
-    data = load_data()
-    for item in data["interactions"]:
-        if item["query"] == question:
-            if correct:
-                item["level"] = min(item["level"] + 1, 3)
-            else:
-                item["level"] = 0
-            item["last_reviewed"] = datetime.now().isoformat()
-            break
-    save_data(data)
+@st.cache_resource(max_entries=users.MAX_ACTIVE_USERS)
+def get_quiz_pool(data_file):
+    """Questions for due cards generated ahead of time on worker threads"""
+    return quiz_pool.QuizPool(functools.partial(pick_quiz_source, data_file), quiz_question)
 
 # ---------------- UI ----------------
 st.title("SpacedRep Bot 🤖")
@@ -79,12 +106,21 @@ st.caption("Spaced Repetition Learning Bot")
 if "chat" not in st.session_state:
     st.session_state.chat = []
 
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
+
 if "quiz_question" not in st.session_state:
     st.session_state.quiz_question = None
 
 if "quiz_topic" not in st.session_state:
     st.session_state.quiz_topic = None
 
+if "quiz_item_id" not in st.session_state:
+    st.session_state.quiz_item_id = None
+
+if "review_session" not in st.session_state:
+    st.session_state.review_session = None
+
 # Display chat
 for msg in st.session_state.chat:
     with st.chat_message(msg["role"]):
@@ -97,23 +133,20 @@ if user_input:
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            types.Content(
-                role="user",
-                parts=[types.Part(text=user_input)]
+    try:
+        context = st.session_state.memory.messages()
+        with st.chat_message("assistant"):
+            reply = st.write_stream(
+                llm.stream_text(client, MODEL_NAME, llm.chat_contents(context, user_input))
             )
-        ]
-    )
-
-    reply = response.text
-    st.session_state.chat.append({"role": "assistant", "content": reply})
-
-    with st.chat_message("assistant"):
-        st.markdown(reply)
+        st.session_state.chat.append({"role": "assistant", "content": reply})
+        st.session_state.memory.record_turn(
+            user_input, reply, llm.summarizer(client, MODEL_NAME)
+        )
 
-    save_interaction(user_input, reply)
+        save_interaction(user_input, reply)
+    except Exception as e:
+        st.error(f"Error: {e}")
 
 # ---------------- QUIZ MODE ----------------
 st.sidebar.header(" Spaced Repetition Quiz")
@@ -121,27 +154,30 @@ st.sidebar.header(" Spaced Repetition Quiz")
 if st.sidebar.button("Quiz me"):
     due_item = get_due_question()
     if due_item:
-        quiz_prompt = (
-            "Create a short conceptual quiz question based on the following topic. "
-            "Do NOT give the answer.\n\n"
-            f"Topic: {due_item['query']}"
-        )
-
-        quiz_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=quiz_prompt)]
-                )
-            ]
-        )
+        pool = get_quiz_pool(DATA_FILE)
+        ready = pool.pop(due_item["id"])
+        try:
+            quiz_text = ready[2] if ready else quiz_question(due_item["id"], due_item["query"])
+        except Exception as e:
+            quiz_text = None
+            st.sidebar.error(f"Error generating quiz: {e}")
+        pool.refill()
 
-        st.session_state.quiz_topic = due_item["query"]
-        st.session_state.quiz_question = quiz_response.text
+        if quiz_text:
+            st.session_state.quiz_topic = due_item["query"]
+            st.session_state.quiz_item_id = due_item["id"]
+            st.session_state.quiz_question = quiz_text
     else:
         st.sidebar.info("No questions due for review right now.")
 
+st.sidebar.caption(f"🗂️ {len(get_due_queue(DATA_FILE).all_due())} cards due now")
+with st.sidebar.expander("📅 Review forecast"):
+    forecast = get_due_queue(DATA_FILE).forecast(FORECAST_DAYS)
+    st.bar_chart({"Reviews due": forecast.tolist()}, height=160)
+    st.caption(f"{forecast.sum()} reviews over the next {FORECAST_DAYS} days (day 0 is today)")
+bank = question_bank.get_bank(BANK_FILE)
+st.sidebar.caption(f"🏦 {len(bank)} questions banked, {len(bank.by_difficulty['hard'])} of them hard for you")
+
 # ---------------- QUIZ DISPLAY ----------------
 if st.session_state.quiz_question:
     st.sidebar.markdown("### 📝 Quiz Question")
@@ -150,43 +186,100 @@ if st.session_state.quiz_question:
     user_answer = st.sidebar.text_area("Your answer:")
 
     if st.sidebar.button("Submit answer"):
-        evaluation_prompt = (
-            "You are an examiner.\n\n"
-            f"Topic: {st.session_state.quiz_topic}\n\n"
-            f"Question: {st.session_state.quiz_question}\n\n"
-            f"Student Answer: {user_answer}\n\n"
-            "Decide whether the answer is correct or incorrect. "
-            "Start your response with either 'Correct:' or 'Incorrect:' "
-            "and then give a brief explanation."
-        )
+        try:
+            grade = grading.grade_answer(
+                client, MODEL_NAME, st.session_state.quiz_topic, st.session_state.quiz_question, user_answer
+            )
+        except Exception as e:
+            st.sidebar.error(f"Evaluation error: {e}")
+            st.stop()
 
-        evaluation_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=evaluation_prompt)]
-                )
-            ]
+        st.sidebar.markdown("### Evaluation")
+        st.sidebar.markdown(grading.format_grade(grade))
+        question_bank.get_bank(BANK_FILE).record_answer(
+            st.session_state.quiz_question, user_answer, grade
         )
 
-        result_text = evaluation_response.text
-        st.sidebar.markdown("### Evaluation")
-        st.sidebar.markdown(result_text)
+        review_card(st.session_state.quiz_item_id, grade)
+        get_quiz_pool(DATA_FILE).refill()
 
-        is_correct = result_text.strip().startswith("Correct:")
-        update_level(st.session_state.quiz_topic, is_correct)
+# ---------------- REVIEW SESSION ----------------
+def start_review_session():
+    """
+    Questions for up to SESSION_SIZE due cards: buffered or banked ones
+    first, the rest in one call.
+    """
+    cards = get_due_queue(DATA_FILE).all_due()[:review.SESSION_SIZE]
+    pool = get_quiz_pool(DATA_FILE)
+    bank = question_bank.get_bank(BANK_FILE)
+    questions = {}
+    for card in cards:
+        ready = pool.pop(card["id"])
+        question = ready[2] if ready else bank.pick(card["id"])
+        if question:
+            questions[card["id"]] = question
+    missing = [(card["id"], card["query"]) for card in cards if card["id"] not in questions]
+    existing = {card_id: bank.variants(card_id) for card_id, _ in missing}
+    generated = review.generate_questions(client, MODEL_NAME, missing, existing)
+    for card_id, topic in missing:
+        if card_id in generated:
+            bank.add(card_id, topic, generated[card_id])
+    questions.update(generated)
+    return [
+        {"id": card["id"], "topic": card["query"], "question": questions[card["id"]]}
+        for card in cards
+        if card["id"] in questions
+    ]
+
+st.sidebar.divider()
+st.sidebar.header("📚 Review Session")
+
+if st.sidebar.button("Start review session"):
+    try:
+        session = start_review_session()
+    except Exception as e:
+        session = None
+        st.sidebar.error(f"Error starting the review session: {e}")
+    if session:
+        st.session_state.review_session = session
+    elif session is not None:
+        st.sidebar.info("No questions due for review right now.")
+
+if st.session_state.review_session:
+    with st.sidebar.form("review_form"):
+        for n, item in enumerate(st.session_state.review_session, 1):
+            st.markdown(f"**{n}.** {item['question']}")
+            st.text_area("Your answer:", key=f"review_answer_{item['id']}")
+        submitted = st.form_submit_button("Submit all answers")
+
+    if submitted:
+        answers = [
+            dict(item, answer=st.session_state.get(f"review_answer_{item['id']}", ""))
+            for item in st.session_state.review_session
+        ]
+        try:
+            grades = review.grade_answers(client, MODEL_NAME, answers)
+        except Exception as e:
+            st.sidebar.error(f"Evaluation error: {e}")
+            st.stop()
+        for n, item in enumerate(answers, 1):
+            st.session_state.pop(f"review_answer_{item['id']}", None)
+            grade = grades.get(item["id"])
+            if grade is None:
+                st.sidebar.warning(f"{n}. Not graded, it stays due.")
+                continue
+            review_card(item["id"], grade)
+            question_bank.get_bank(BANK_FILE).record_answer(item["question"], item["answer"], grade)
+            st.sidebar.markdown(f"**{n}.** {grading.format_grade(grade)}")
+        st.session_state.review_session = None
+        get_quiz_pool(DATA_FILE).refill()
 
 # ---------------- HISTORY ----------------
 st.sidebar.divider()
 st.sidebar.header(" Saved Chat History")
 
-if st.sidebar.button("Load saved chats"):
-    data = load_data()
-    for item in data["interactions"]:
-        st.sidebar.markdown(
-            f"**Q:** {item['query']}\n\n"
-            f"**A:** {item['response']}\n\n"
-            f"**Level:** {item['level']}\n"
-            f"⏱ {item['last_reviewed']}\n---"
-        )
+if st.sidebar.toggle("Load saved chats"):
+    history_browser.render_history(DATA_FILE, "history_page", format_history_item, field="query")
+
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
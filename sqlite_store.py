@@ -0,0 +1,259 @@
+"""SQLite backend for chat history (enable with ``CHAT_STORAGE=sqlite``).
+
+Each history file ``foo.json`` maps to a ``foo.db`` database in WAL mode.
+The full record is kept as JSON, and the fields the bots filter or sort
+on are copied into indexed columns so those lookups are index seeks. Every
+insert or update stamps the row with the next ``revision``, so ``changes``
+reads only rows written since the caller last looked.
+
+Migrate an existing JSON history once with::
+
+    python sqlite_store.py chat_history.json
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+INDEXED_FIELDS = ["id", "query", "time", "topic", "personality", "level", "last_reviewed"]
+COLUMNS = ["item_id", "query", "time", "topic", "personality", "level", "last_reviewed"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY,
+    record TEXT NOT NULL,
+    item_id TEXT,
+    query TEXT,
+    time TEXT,
+    topic TEXT,
+    personality TEXT,
+    level INTEGER,
+    last_reviewed TEXT,
+    revision INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_item_id ON interactions(item_id);
+CREATE INDEX IF NOT EXISTS idx_interactions_query ON interactions(query);
+CREATE INDEX IF NOT EXISTS idx_interactions_time ON interactions(time);
+CREATE INDEX IF NOT EXISTS idx_interactions_topic ON interactions(topic);
+CREATE INDEX IF NOT EXISTS idx_interactions_personality ON interactions(personality);
+CREATE INDEX IF NOT EXISTS idx_interactions_due ON interactions(level, last_reviewed);
+CREATE INDEX IF NOT EXISTS idx_interactions_revision ON interactions(revision);
+"""
+
+_local = threading.local()
+
+
+# ---------------- CONNECTION ----------------
+def db_path(path):
+    return os.path.splitext(path)[0] + ".db"
+
+
+def connect(path):
+    """Per-thread connection, created (and migrated) on first use"""
+    connections = _local.__dict__.setdefault("connections", {})
+    database = db_path(path)
+    if database in connections:
+        return connections[database]
+
+    is_new = not os.path.exists(database)
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _upgrade(conn)
+    conn.executescript(SCHEMA)
+    connections[database] = conn
+
+    if is_new and os.path.exists(path):
+        migrate_json(path)
+    return conn
+
+
+def _upgrade(conn):
+    """Add the item_id and revision columns to databases created before them"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(interactions)")]
+    if columns and "item_id" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE interactions ADD COLUMN item_id TEXT")
+            conn.execute("UPDATE interactions SET item_id = 'legacy-' || (id - 1)")
+            conn.execute("UPDATE interactions SET record = json_set(record, '$.id', item_id)")
+    if columns and "revision" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE interactions ADD COLUMN revision INTEGER")
+            conn.execute("UPDATE interactions SET revision = id")
+
+
+def _columns(item):
+    return [item.get(field) for field in INDEXED_FIELDS]
+
+
+_NEXT_REVISION = "(SELECT coalesce(max(revision), 0) + 1 FROM interactions)"
+
+
+def _insert(conn, item):
+    conn.execute(
+        f"INSERT INTO interactions (record, {', '.join(COLUMNS)}, revision) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, {_NEXT_REVISION})",
+        [json.dumps(item)] + _columns(item)
+    )
+
+
+# ---------------- HELPERS ----------------
+def load_data(path):
+    conn = connect(path)
+    # Read before the rows, so a rewrite in between only causes a needless re-index
+    generation = conn.execute("PRAGMA user_version").fetchone()[0]
+    rows = conn.execute("SELECT record FROM interactions ORDER BY id")
+    return {"interactions": [json.loads(record) for (record,) in rows], "generation": generation}
+
+
+def changes(path, cursor=None):
+    """``storage.changes`` for a database; the cursor is (generation, last row id, last revision)"""
+    conn = connect(path)
+    generation = conn.execute("PRAGMA user_version").fetchone()[0]
+    if cursor is None or cursor[0] != generation:
+        rows = conn.execute("SELECT id, revision, record FROM interactions ORDER BY id").fetchall()
+        last_id = 0
+        reset = True
+    else:
+        _, last_id, last_revision = cursor
+        rows = conn.execute(
+            "SELECT id, revision, record FROM interactions WHERE revision > ? ORDER BY revision",
+            (last_revision,)
+        ).fetchall()
+        rows.sort()  # Ordered by revision to use its index; records go back in row order
+        reset = False
+    added = [json.loads(record) for row_id, _, record in rows if row_id > last_id]
+    updated = [json.loads(record) for row_id, _, record in rows if row_id <= last_id]
+    if rows:
+        last_id = max(last_id, rows[-1][0])
+        last_revision = max(revision for _, revision, _ in rows)
+    elif reset:
+        last_revision = 0
+    return {"reset": reset, "added": added, "updated": updated,
+            "cursor": (generation, last_id, last_revision)}
+
+
+def save_data(path, data):
+    """Replace every record and bump the generation (``user_version``)"""
+    conn = connect(path)
+    with conn:
+        conn.execute("DELETE FROM interactions")
+        generation = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute(f"PRAGMA user_version = {generation + 1}")
+        for item in data.get("interactions", []):
+            _insert(conn, item)
+
+
+def append_interaction(path, item):
+    conn = connect(path)
+    with conn:
+        _insert(conn, item)
+
+
+def update_interaction(path, item_id, fields):
+    update_interactions(path, {item_id: fields})
+
+
+def update_interactions(path, updates):
+    """Apply ``{item_id: fields}`` in one transaction"""
+    conn = connect(path)
+    assignments = ", ".join(f"{column} = ?" for column in COLUMNS)
+    with conn:
+        for item_id, fields in updates.items():
+            item = get_interaction(path, item_id)
+            if item is None:
+                continue
+            item.update(fields)
+            conn.execute(
+                f"UPDATE interactions SET record = ?, {assignments}, revision = {_NEXT_REVISION} "
+                "WHERE item_id = ?",
+                [json.dumps(item)] + _columns(item) + [item_id]
+            )
+
+
+def get_interaction(path, item_id):
+    row = connect(path).execute(
+        "SELECT record FROM interactions WHERE item_id = ?", (item_id,)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def recent_interactions(path, limit):
+    rows = connect(path).execute(
+        "SELECT record FROM interactions ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [json.loads(record) for (record,) in reversed(rows)]
+
+
+def page_interactions(path, cursor=None, limit=20, field=None, scan_limit=2000):
+    """
+    Keyset-paged history, newest first; the cursor is a row id. With
+    ``field`` only the ``scan_limit`` rows below the cursor are looked at,
+    so a sparse field gives a short page and a cursor to carry on from.
+    """
+    conn = connect(path)
+    clauses, params = [], []
+    if cursor is not None:
+        clauses.append("id < ?")
+        params.append(cursor)
+    lower = 0
+    if field is not None:
+        if cursor is None:
+            (cursor,) = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM interactions").fetchone()
+        lower = max(0, cursor - scan_limit)
+        clauses.append("id >= ?")
+        params.append(lower)
+        if field in INDEXED_FIELDS:
+            clauses.append(f"{COLUMNS[INDEXED_FIELDS.index(field)]} IS NOT NULL")
+        else:
+            clauses.append("json_extract(record, ?) IS NOT NULL")
+            params.append(f"$.{field}")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT id, record FROM interactions {where} ORDER BY id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+    if len(rows) > limit:
+        next_cursor = rows[limit - 1][0]
+    else:
+        next_cursor = lower if lower > 1 else None
+    return [json.loads(record) for _, record in rows[:limit]], next_cursor
+
+
+def random_interaction(path):
+    """Pick a random record that has a query, without reading the table"""
+    conn = connect(path)
+    (max_id,) = conn.execute("SELECT max(id) FROM interactions").fetchone()
+    if max_id is None:
+        return None
+    pivot = random.randint(1, max_id)
+    row = conn.execute(
+        "SELECT record FROM interactions WHERE id >= ? AND query IS NOT NULL ORDER BY id LIMIT 1",
+        (pivot,)
+    ).fetchone() or conn.execute(
+        "SELECT record FROM interactions WHERE query IS NOT NULL ORDER BY id LIMIT 1"
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+# ---------------- MIGRATION ----------------
+def migrate_json(path):
+    """Copy a JSON history (snapshot plus journal) into its database once"""
+    import storage
+
+    conn = connect(path)
+    (count,) = conn.execute("SELECT count(*) FROM interactions").fetchone()
+    if count:
+        return 0
+    interactions = storage.load_journal_data(path)["interactions"]
+    with conn:
+        for item in interactions:
+            _insert(conn, item)
+    return len(interactions)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "chat_history.json"
+    print(f"Migrated {migrate_json(source)} interactions into {db_path(source)}")
@@ -0,0 +1,646 @@
+"""Append-only journaled storage shared by all the bots.
+
+The history file keeps its original ``{"interactions": [...]}`` layout as a
+snapshot, and every change is appended as one JSON line to ``<file>.log``
+next to it. A chat turn therefore costs a single small write instead of a
+full parse and rewrite. Once the journal grows past ``COMPACT_BYTES`` it is
+folded back into the snapshot.
+
+``load_data`` also returns the history's ``generation``, which changes only
+when ``save_data`` rewrites it. Indexes built from the records
+(``HistoryIndex``) pick up appended records from the end and start over
+when the generation changes.
+
+Set ``CHAT_STORAGE=sqlite`` to keep history in an indexed SQLite database
+instead (see ``sqlite_store.py``); the helpers below dispatch to it.
+
+Writers take an exclusive advisory lock on ``<file>.lock`` and readers a
+shared one, so several server processes can use the same files safely.
+``user_path`` gives each learner their own set of files.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+import metrics
+import sqlite_store
+import users
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("CHAT_STORAGE", "json")
+DATA_DIR = os.getenv("CHAT_DATA_DIR", "data")
+
+COMPACT_BYTES = 1024 * 1024  # Fold the journal into the snapshot past ~1 MB
+PAGE_SCAN_LIMIT = 2000       # Records a filtered page may look at before returning
+MAX_CACHED_FILES = 2 * users.MAX_ACTIVE_USERS  # A history and a question bank per learner
+
+# Streamlit sessions and background workers share one process, so writes
+# are serialized here as well as across processes by the file lock.
+_write_lock = threading.RLock()
+_held = threading.local()
+
+
+# ---------------- PATHS ----------------
+def user_path(filename, user_id=None):
+    """
+    Where ``filename`` lives for one learner: ``data/<slug>-<hash>/<filename>``.
+    The slug is a readable but lossy form of the ID; the hash of the exact ID
+    keeps two accounts that share a slug apart. Without a user ID this is
+    ``filename`` itself, the shared single-user file.
+    """
+    if not user_id:
+        return filename
+    user_id = str(user_id)
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id).strip(".")[:40] or "_"
+    digest = hashlib.sha256(user_id.encode()).hexdigest()[:16]
+    directory = os.path.join(DATA_DIR, f"{slug}-{digest}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def _journal_path(path):
+    return f"{path}.log"
+
+
+# ---------------- LOCKING ----------------
+@contextmanager
+def _file_lock(path, exclusive=True):
+    """
+    Advisory lock on ``<path>.lock``. Re-entrant within a thread, so a writer
+    that compacts or reads while holding the lock does not deadlock itself.
+    """
+    depth = _held.__dict__.setdefault("depth", {})
+    if depth.get(path):
+        depth[path] += 1
+        try:
+            yield
+        finally:
+            depth[path] -= 1
+        return
+
+    thread_lock = _write_lock if exclusive else None
+    if thread_lock:
+        thread_lock.acquire()
+    try:
+        with open(f"{path}.lock", "a") as handle:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            depth[path] = 1
+            try:
+                yield
+            finally:
+                depth[path] = 0
+                if fcntl:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    finally:
+        if thread_lock:
+            thread_lock.release()
+
+
+def _segment_paths(path):
+    """Rotated journal segments as (segment_id, path), oldest first"""
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(_journal_path(path)) + "."
+    segments = []
+    if not os.path.isdir(directory):
+        return segments
+    for name in os.listdir(directory):
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit():
+            segments.append((int(suffix), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+# ---------------- READING ----------------
+def _read_snapshot(path):
+    if not os.path.exists(path):
+        return {"interactions": []}
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+            metrics.add("bytes_read", f.tell())
+            return snapshot
+    except json.JSONDecodeError:
+        # Keep a copy before a later write replaces the damaged file
+        backup = f"{path}.corrupt-{time.time_ns()}"
+        shutil.copyfile(path, backup)
+        logger.warning("Could not parse %s; saved a copy to %s", path, backup)
+        return {"interactions": []}
+
+
+def _read_journal(journal, repair=False):
+    """Parse a journal file, recovering from a torn final line"""
+    try:
+        with open(journal, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return []
+    metrics.add("bytes_read", len(raw))
+
+    end = raw.rfind(b"\n") + 1
+    entries = []
+    for line in raw[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            # Skip one damaged record rather than losing the whole history
+            continue
+
+    tail = raw[end:]
+    if tail.strip():
+        try:
+            entries.append(json.loads(tail))
+            if repair:
+                # The record made it to disk but its newline did not
+                with open(journal, "ab") as f:
+                    f.write(b"\n")
+        except json.JSONDecodeError:
+            if repair:
+                # Crash mid-append: drop the partial record
+                with open(journal, "r+b") as f:
+                    f.truncate(end)
+    return entries
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def _ensure_ids(interactions):
+    """Give records written before IDs existed a stable positional ID"""
+    for index, item in enumerate(interactions):
+        item.setdefault("id", f"legacy-{index}")
+    return interactions
+
+
+def _apply(interactions, entry, positions):
+    op = entry.get("op")
+    if op == "add":
+        item = entry["item"]
+        item.setdefault("id", f"legacy-{len(interactions)}")
+        positions[item["id"]] = len(interactions)
+        interactions.append(item)
+    elif op == "update":
+        index = positions.get(entry.get("id"), entry.get("index", -1))
+        if 0 <= index < len(interactions):
+            interactions[index].update(entry["fields"])
+            return index
+    return None
+
+
+def _positions(interactions):
+    return {item["id"]: index for index, item in enumerate(interactions)}
+
+
+def _replay(interactions, entries, updates=None):
+    """Apply journal entries; positions they update are appended to ``updates``"""
+    positions = _positions(interactions)
+    for entry in entries:
+        index = _apply(interactions, entry, positions)
+        if index is not None and updates is not None:
+            updates.append(index)
+
+
+def _replay_segments(path, interactions, folded, updates=None):
+    for segment_id, segment_path in _segment_paths(path):
+        if segment_id > folded:
+            _replay(interactions, _read_journal(segment_path), updates)
+
+
+def load_journal_data(path):
+    """
+    Load the snapshot and replay any journal entries on top of it. Also
+    returns the positions updated since the snapshot was folded, in order.
+    """
+    updates = []
+    with _file_lock(path, exclusive=False):
+        snapshot = _read_snapshot(path)
+        interactions = _ensure_ids(snapshot.get("interactions", []))
+        folded = snapshot.get("folded_segment", 0)
+        _replay_segments(path, interactions, folded, updates)
+        _replay(interactions, _read_journal(_journal_path(path)), updates)
+    return {
+        "interactions": interactions,
+        "generation": snapshot.get("generation", 0),
+        "folded_segment": folded,
+        "updates": updates
+    }
+
+
+# ---------------- IN-MEMORY CACHE ----------------
+class _LRU(OrderedDict):
+    """A dict keeping only its ``max_entries`` most recently used keys"""
+    def __init__(self, max_entries):
+        super().__init__()
+        self.max_entries = max_entries
+
+    def get(self, key, default=None):
+        try:
+            self.move_to_end(key)
+        except KeyError:
+            return default
+        return super().get(key, default)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_entries:
+            self.popitem(last=False)
+
+
+# path -> [signature, interactions, positions, generation, folded segment,
+# updated positions since that fold]. Every bot reads the history
+# several times per rerun; the parsed copy is reused until the files change
+# on disk, and this process's own writes are applied to it directly.
+_cache = _LRU(MAX_CACHED_FILES)
+
+
+def _stat(path):
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def _signature(path):
+    return _stat(path), _stat(_journal_path(path))
+
+
+def _cached(path):
+    """Parsed interactions for ``path``; treat the list as read-only"""
+    signature = _signature(path)
+    entry = _cache.get(path)
+    if entry is None or entry[0] != signature:
+        metrics.add("cache_misses")
+        data = load_journal_data(path)
+        interactions = data["interactions"]
+        entry = [signature, interactions, _positions(interactions), data["generation"],
+                 data["folded_segment"], data["updates"]]
+        _cache[path] = entry
+    else:
+        metrics.add("cache_hits")
+    return entry
+
+
+def _fresh_cache(path, signature):
+    """The cache entry if it still matches the files as of ``signature``"""
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == signature:
+        return entry
+    _cache.pop(path, None)
+    return None
+
+
+# ---------------- WRITING ----------------
+def _append_entry(path, entry):
+    _append_entries(path, [entry])
+
+
+def _append_entries(path, entries):
+    """Journal ``entries`` with a single write and fsync"""
+    journal = _journal_path(path)
+    line = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+
+    with _file_lock(path):
+        cached = _fresh_cache(path, _signature(path))
+        with open(journal, "ab") as f:
+            if f.tell() > 0:
+                with open(journal, "rb") as check:
+                    check.seek(-1, os.SEEK_END)
+                    torn = check.read(1) != b"\n"
+                if torn:
+                    # A previous writer crashed mid-line; repair before appending
+                    _read_journal(journal, repair=True)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.add("bytes_written", len(line))
+
+        if cached is not None:
+            for entry in entries:
+                index = _apply(cached[1], entry, cached[2])
+                if index is not None:
+                    cached[5].append(index)
+            cached[0] = _signature(path)
+
+        if os.path.getsize(journal) >= COMPACT_BYTES:
+            compact(path)
+
+
+def _write_snapshot(path, interactions, generation=None):
+    """
+    Rotate the live journal away and atomically replace the snapshot. A
+    rewrite passes a new ``generation``; compaction keeps the current one.
+    """
+    with _file_lock(path):
+        if interactions is None:
+            cached = _fresh_cache(path, _signature(path))
+            if cached is not None:
+                interactions, generation = cached[1], cached[3]
+        interactions, generation, segment = _rotate_and_write(path, interactions, generation)
+        _cache[path] = [_signature(path), interactions, _positions(interactions), generation,
+                        segment, []]
+
+
+def _rotate_and_write(path, interactions, generation):
+    segment = time.time_ns()
+    journal = _journal_path(path)
+    if os.path.exists(journal):
+        os.replace(journal, f"{journal}.{segment}")
+
+    if interactions is None:
+        snapshot = _read_snapshot(path)
+        interactions = _ensure_ids(snapshot.get("interactions", []))
+        _replay_segments(path, interactions, snapshot.get("folded_segment", 0))
+        generation = snapshot.get("generation", 0)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(
+            {"interactions": interactions, "folded_segment": segment, "generation": generation},
+            f, indent=4
+        )
+        f.flush()
+        os.fsync(f.fileno())
+        metrics.add("bytes_written", f.tell())
+    os.replace(tmp, path)
+
+    # The new snapshot covers these segments now
+    for segment_id, segment_path in _segment_paths(path):
+        if segment_id <= segment:
+            os.remove(segment_path)
+    return interactions, generation, segment
+
+
+def compact(path):
+    """Fold the journal into the snapshot file"""
+    _write_snapshot(path, None)
+
+
+# ---------------- JSON DOCUMENTS ----------------
+_documents = _LRU(MAX_CACHED_FILES)  # path -> (signature, data)
+
+
+def load_json(path, default):
+    """
+    Load a small JSON document such as the stats file, re-reading it only
+    when its mtime or size changed. Returns a copy the caller may modify.
+    """
+    with metrics.timed("load_json", os.path.basename(path)):
+        signature = _stat(path)
+        cached = _documents.get(path)
+        if cached is None or cached[0] != signature:
+            metrics.add("cache_misses")
+            with _file_lock(path, exclusive=False):
+                signature = _stat(path)
+                if signature is None:
+                    data = default
+                else:
+                    try:
+                        with open(path, "r") as f:
+                            data = json.load(f)
+                            metrics.add("bytes_read", f.tell())
+                    except json.JSONDecodeError:
+                        data = default
+            cached = (signature, data)
+            _documents[path] = cached
+        else:
+            metrics.add("cache_hits")
+        return copy.deepcopy(cached[1])
+
+
+def save_json(path, data):
+    """Atomically write a JSON document and keep the cached copy in step"""
+    with metrics.timed("save_json", os.path.basename(path)), _file_lock(path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.add("bytes_written", f.tell())
+        os.replace(tmp, path)
+        _documents[path] = (_stat(path), copy.deepcopy(data))
+
+
+# ---------------- PUBLIC HELPERS ----------------
+def load_data(path):
+    with metrics.timed("load_data", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            return sqlite_store.load_data(path)
+        entry = _cached(path)
+        return {"interactions": list(entry[1]), "generation": entry[3]}
+
+
+def changes(path, cursor=None):
+    """
+    What changed in the history since ``cursor`` (None to start), as a dict:
+
+    - ``reset``: the history was rewritten (or this is the first call) and
+      ``added`` holds every record
+    - ``added``: records appended since, in order
+    - ``updated``: earlier records updated since, or None when that is no
+      longer known (the journal was folded meanwhile)
+    - ``cursor``: pass back on the next call
+
+    Costs O(changes): the JSON backend only stats its files when nothing
+    changed, and SQLite reads only rows with a newer revision.
+    """
+    with metrics.timed("changes", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            return sqlite_store.changes(path, cursor)
+        _, interactions, _, generation, folded, updates = _cached(path)
+        seen_updates = len(updates)
+        count = len(interactions)
+        if cursor is None or cursor[0] != generation or cursor[2] > count:
+            return {"reset": True, "added": interactions[:count], "updated": [],
+                    "cursor": (generation, folded, count, seen_updates)}
+        _, last_folded, last_count, last_updates = cursor
+        if last_folded != folded:
+            updated = None
+        else:
+            # Records added since the cursor already carry their updates
+            positions = dict.fromkeys(updates[last_updates:seen_updates])
+            updated = [interactions[index] for index in positions if index < last_count]
+        return {"reset": False, "added": interactions[last_count:count], "updated": updated,
+                "cursor": (generation, folded, count, seen_updates)}
+
+
+def save_data(path, data):
+    """Replace the whole history (e.g. when clearing it)"""
+    with metrics.timed("save_data", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            return sqlite_store.save_data(path, data)
+        _write_snapshot(path, data.get("interactions", []), time.time_ns())
+
+
+def append_interaction(path, item):
+    """Append a record, assigning it a stable ``id``; returns the ID"""
+    item.setdefault("id", new_id())
+    with metrics.timed("append_interaction", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            sqlite_store.append_interaction(path, item)
+        else:
+            _append_entry(path, {"op": "add", "item": item})
+    return item["id"]
+
+
+def update_interaction(path, item_id, fields):
+    with metrics.timed("update_interaction", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            return sqlite_store.update_interaction(path, item_id, fields)
+        _append_entry(path, {"op": "update", "id": item_id, "fields": fields})
+
+
+def update_interactions(path, updates):
+    """Apply ``{item_id: fields}`` as one journaled batch (one transaction on SQLite)"""
+    if not updates:
+        return
+    with metrics.timed("update_interactions", os.path.basename(path)):
+        if BACKEND == "sqlite":
+            return sqlite_store.update_interactions(path, updates)
+        _append_entries(path, [
+            {"op": "update", "id": item_id, "fields": fields} for item_id, fields in updates.items()
+        ])
+
+
+def recent_interactions(path, limit):
+    if BACKEND == "sqlite":
+        return sqlite_store.recent_interactions(path, limit)
+    return _cached(path)[1][-limit:]
+
+
+def page_interactions(path, cursor=None, limit=20, field=None):
+    """
+    One page of history, newest first, for records that have ``field``
+    (all records if None). Pass the returned cursor back to get the next,
+    older page; it is None on the last page. Costs O(page), not O(history):
+    with ``field`` at most ``PAGE_SCAN_LIMIT`` records are looked at, so
+    where the field is sparse a page can come back short (even empty) with
+    a cursor to carry on from.
+    """
+    if BACKEND == "sqlite":
+        return sqlite_store.page_interactions(path, cursor, limit, field, PAGE_SCAN_LIMIT)
+    interactions = _cached(path)[1]
+    index = len(interactions) if cursor is None else min(cursor, len(interactions))
+    page = []
+    stop = max(0, index - PAGE_SCAN_LIMIT)
+    while index > 0:
+        if index == stop:
+            return page, index
+        index -= 1
+        item = interactions[index]
+        if field is not None and field not in item:
+            continue
+        if len(page) == limit:
+            # One more match exists, so there is an older page
+            return page, index + 1
+        page.append(item)
+    return page, None
+
+
+def random_interaction(path):
+    if BACKEND == "sqlite":
+        return sqlite_store.random_interaction(path)
+    interactions = [item for item in _cached(path)[1] if "query" in item]
+    if not interactions:
+        return None
+    return random.choice(interactions)
+
+
+def get_interaction(path, item_id):
+    if BACKEND == "sqlite":
+        return sqlite_store.get_interaction(path, item_id)
+    interactions, positions = _cached(path)[1:3]
+    index = positions.get(item_id)
+    return interactions[index] if index is not None else None
+
+
+# ---------------- DERIVED INDEXES ----------------
+class HistoryIndex:
+    """
+    Base for in-memory indexes built from a history file's records.
+    Subclasses hold ``self.lock`` and define ``_reset`` (which sets
+    ``synced`` back to 0) and ``_index(record)``, or ``_index_many(records)``
+    to index a batch at once; those that care about
+    updated records also define ``_update(record)`` and
+    ``_update_all(records)``, for when the updates are not known.
+    """
+    synced = 0         # records consumed so far
+    generation = None  # storage generation they came from
+    cursor = None      # ``changes`` cursor for ``refresh``
+
+    def sync(self, records, generation=None):
+        """Index records appended since the last call; start over after a rewrite"""
+        with self.lock:
+            if generation != self.generation or len(records) < self.synced:
+                self._reset()
+                self.generation = generation
+            self._index_many(records[self.synced:])
+            self.synced = len(records)
+
+    def _index_many(self, records):
+        for record in records:
+            self._index(record)
+
+    def _update(self, record):
+        pass
+
+    def _update_all(self, records):
+        pass
+
+    def refresh(self, path):
+        """Bring the index up to date with the history at ``path``, reading only what changed"""
+        with self.lock:
+            changed = changes(path, self.cursor)
+            if changed["reset"]:
+                self._reset()
+            self._index_many(changed["added"])
+            self.synced += len(changed["added"])
+            if changed["updated"] is None:
+                self._update_all(load_data(path)["interactions"])
+            else:
+                for record in changed["updated"]:
+                    self._update(record)
+            self.cursor = changed["cursor"]
+
+
+class IndexCache:
+    """
+    One ``factory(path)`` index per history file, refreshed on every
+    ``get``; only the ``max_entries`` most recently used are kept.
+    """
+    def __init__(self, factory, max_entries=users.MAX_ACTIVE_USERS):
+        self.factory = factory
+        self.indexes = _LRU(max_entries)
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        with self.lock:
+            index = self.indexes.get(path)
+            if index is None:
+                index = self.indexes[path] = self.factory(path)
+        index.refresh(path)
+        return index
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
@@ -0,0 +1,21 @@
+"""Per-learner paths in ``storage``."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage
+
+
+def test_user_paths_do_not_collide(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    first = storage.user_path("chat_history.json", "john+x@gmail.com")
+    second = storage.user_path("chat_history.json", "john_x@gmail.com")
+    assert first != second
+    assert os.path.dirname(first) != os.path.dirname(second)
+    assert storage.user_path("chat_history.json", "john+x@gmail.com") == first
+
+
+def test_no_user_keeps_the_shared_file():
+    assert storage.user_path("chat_history.json") == "chat_history.json"
@@ -0,0 +1,40 @@
+"""Timebot's quiz countdown, driven headlessly with Streamlit's AppTest."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+pytest.importorskip("google.genai")
+
+from fake_genai import FakeClient
+from streamlit.testing.v1 import AppTest
+
+import llm
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(llm, "get_client", lambda api_key: FakeClient(latency=0, tokens=5))
+    app = AppTest.from_file(os.path.join(ROOT, "timebot.py"), default_timeout=30)
+    app.secrets["GEMINI_API_KEY"] = "offline"
+    return app
+
+
+def test_overdue_quiz_with_empty_history_tries_once(app):
+    app.session_state["last_message_time"] = datetime.now() - timedelta(hours=1)
+    app.run()
+    assert not app.exception
+    assert any("No chat history" in warning.value for warning in app.sidebar.warning)
+    assert app.session_state["quiz_attempted_for"] is not None
+    assert not app.session_state["quiz_shown"]
+
+    # Later reruns neither retry nor loop
+    app.run()
+    assert not app.exception
+    assert not app.sidebar.warning
@@ -1,86 +1,124 @@
 import streamlit as st
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-import random
-import json
+import asyncio
+import functools
 import os
 from datetime import datetime, timedelta
-import time
+import math
+
+import grading
+import history_browser
+import llm
+import memory
+import metrics
+import pipeline
+import question_bank
+import quiz_pool
+import retrieval
+import storage
+import users
 
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="Timebot", layout="centered")
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = llm.get_client(os.getenv("GEMINI_API_KEY"))
 
 MODEL_NAME = "gemini-2.5-flash-lite"
-DATA_FILE = "chat_history.json"
+DATA_FILE = storage.user_path("chat_history.json", users.current_user_id())
+BANK_FILE = storage.user_path("question_bank.json", users.current_user_id())
 QUIZ_DELAY_MINUTES = 10  # Quiz after 10 minutes
+TIMER_TICK_SECONDS = 15  # How often the countdown redraws
 
 # ---------------- JSON HELPERS ----------------
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"interactions": []}
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return {"interactions": []}
+    return storage.load_data(DATA_FILE)
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    storage.save_data(DATA_FILE, data)
 
 def save_interaction(query, response):
-    data = load_data()
-    data["interactions"].append({
+    storage.append_interaction(DATA_FILE, {
         "query": query,
         "response": response,
         "time": datetime.now().isoformat()
     })
-    save_data(data)
 
-def get_random_query_from_history():
-    data = load_data()
-    interactions = data.get("interactions", [])
-    if not interactions:
-        return None
-    return random.choice(interactions)["query"]
+def format_history_item(item, shorten):
+    return (
+        f"**Q:** {shorten(item['query'])}\n\n"
+        f"**A:** {shorten(item['response'])}\n\n"
+        f"⏱ {item.get('time', '')}\n---"
+    )
 
-def generate_quiz():
-    """Generate a quiz question from chat history"""
-    quiz_source = get_random_query_from_history()
-    
-    if quiz_source is None:
-        st.sidebar.warning("No chat history available to generate a quiz.")
-        return
-    
-    quiz_prompt = (
+def build_quiz_prompt(topic):
+    return (
         "Create a short conceptual quiz question based on the following topic. "
         "Do NOT give the answer.\n\n"
-        f"Topic: {quiz_source}"
+        f"Topic: {topic}"
     )
-    
-    try:
-        quiz_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=quiz_prompt)]
-                )
-            ]
-        )
-        st.session_state.quiz_topic = quiz_source
-        st.session_state.quiz_question = quiz_response.text
-        st.session_state.quiz_shown = True
-        st.session_state.evaluation_result = None
-    except Exception as e:
-        st.sidebar.error(f"Error generating quiz: {e}")
+
+def generate_quiz_question(topic, existing=()):
+    # A variant must differ from the banked ones, so only a first question is cached
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return llm.generate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
+
+async def agenerate_quiz_question(topic, existing=()):
+    prompt = question_bank.variant_prompt(build_quiz_prompt(topic), existing)
+    return await llm.agenerate_text(
+        client, MODEL_NAME, llm.user_content(prompt), cache=not existing, site="quiz-gen"
+    )
+
+def quiz_question(source_id, topic):
+    """A banked question for this source, generated only when its bank runs dry"""
+    return question_bank.get_bank(BANK_FILE).question_for(source_id, topic, generate_quiz_question)
+
+async def aquiz_question(source_id, topic):
+    # Loading the bank reads the file under its lock; keep that off the event loop
+    bank = await asyncio.to_thread(question_bank.get_bank, BANK_FILE)
+    return await bank.aquestion_for(source_id, topic, agenerate_quiz_question)
+
+def pick_quiz_source(data_file, exclude):
+    """A past query unlike the ones already buffered"""
+    return retrieval.sample_source(data_file, exclude)
+
+@st.cache_resource(max_entries=users.MAX_ACTIVE_USERS)
+def get_quiz_pool(data_file):
+    """Quiz questions generated ahead of time on worker threads, per history file"""
+    return quiz_pool.QuizPool(functools.partial(pick_quiz_source, data_file), quiz_question)
+
+def generate_quiz():
+    """Generate a quiz question from chat history"""
+    pool = get_quiz_pool(DATA_FILE)
+    # Prepared while the previous answer was being graded
+    ready = st.session_state.pop("upcoming_quiz", None) or pool.pop()
+    pool.refill()
+
+    if ready:
+        _, quiz_source, quiz_text = ready
+    else:
+        source = retrieval.sample_source(DATA_FILE)
+        if source is None:
+            st.sidebar.warning("No chat history available to generate a quiz.")
+            return
+        quiz_source = source[1]
+        try:
+            quiz_text = quiz_question(*source)
+        except Exception as e:
+            st.sidebar.error(f"Error generating quiz: {e}")
+            return
+
+    st.session_state.quiz_topic = quiz_source
+    st.session_state.quiz_question = quiz_text
+    st.session_state.quiz_shown = True
+    st.session_state.evaluation_result = None
 
 # ---------------- INITIALIZE SESSION STATE ----------------
 if "chat" not in st.session_state:
     st.session_state.chat = []
+if "memory" not in st.session_state:
+    st.session_state.memory = memory.ConversationMemory()
 if "quiz_question" not in st.session_state:
     st.session_state.quiz_question = None
 if "quiz_topic" not in st.session_state:
@@ -89,6 +127,8 @@ if "last_message_time" not in st.session_state:
     st.session_state.last_message_time = None
 if "quiz_shown" not in st.session_state:
     st.session_state.quiz_shown = False
+if "quiz_attempted_for" not in st.session_state:
+    st.session_state.quiz_attempted_for = None  # Due time of the last automatic quiz
 if "evaluation_result" not in st.session_state:
     st.session_state.evaluation_result = None
 
@@ -96,10 +136,19 @@ if "evaluation_result" not in st.session_state:
 st.title("Timebot ⏱️")
 st.caption(f"Quizzes you {QUIZ_DELAY_MINUTES} minutes after your last message!")
 
-# Check if it's time to show quiz
-if (st.session_state.last_message_time is not None 
-    and not st.session_state.quiz_shown 
-    and datetime.now() - st.session_state.last_message_time >= timedelta(minutes=QUIZ_DELAY_MINUTES)):
+def quiz_due_time():
+    return st.session_state.last_message_time + timedelta(minutes=QUIZ_DELAY_MINUTES)
+
+def quiz_pending():
+    """A quiz is waiting for its due time and has not been tried for it yet"""
+    return (st.session_state.last_message_time is not None
+            and not st.session_state.quiz_shown
+            and st.session_state.quiz_attempted_for != quiz_due_time())
+
+# Check if it's time to show quiz; one automatic try per due time, so an
+# empty history or a failed call doesn't rerun the page over and over
+if quiz_pending() and datetime.now() >= quiz_due_time():
+    st.session_state.quiz_attempted_for = quiz_due_time()
     generate_quiz()
 
 # Display chat history
@@ -123,54 +172,50 @@ if user_input:
         st.markdown(user_input)
 
     try:
-        # Get Gemini response
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=user_input)]
-                )
-            ]
-        )
-        reply = response.text
+        # Stream Gemini response as it is generated
+        context = st.session_state.memory.messages()
+        with st.chat_message("assistant"):
+            reply = st.write_stream(
+                llm.stream_text(client, MODEL_NAME, llm.chat_contents(context, user_input))
+            )
 
         # Add assistant message
         st.session_state.chat.append({"role": "assistant", "content": reply})
-        with st.chat_message("assistant"):
-            st.markdown(reply)
+        st.session_state.memory.record_turn(
+            user_input, reply, llm.summarizer(client, MODEL_NAME)
+        )
 
         # Save to JSON
         save_interaction(user_input, reply)
+        get_quiz_pool(DATA_FILE).refill()
     
     except Exception as e:
         st.error(f"Error: {e}")
 
 # ---------------- TIMER DISPLAY ----------------
-if st.session_state.last_message_time and not st.session_state.quiz_shown:
-    time_elapsed = (datetime.now() - st.session_state.last_message_time).total_seconds()
-    time_remaining = max(0, QUIZ_DELAY_MINUTES - time_elapsed)
-    
+def quiz_countdown():
+    """
+    Runs as a fragment on a timer, so each tick redraws only the countdown.
+    Once the quiz is due it triggers one full rerun, which shows the quiz.
+    """
+    if not quiz_pending():
+        return
+    time_remaining = (quiz_due_time() - datetime.now()).total_seconds()
+
     if time_remaining > 0:
-        st.info(f"⏱️ Quiz will appear in {int(time_remaining)} minutes...")
-        # Auto-refresh every minute to update timer
-        time.sleep()
+        st.info(f"⏱️ Quiz will appear in {math.ceil(time_remaining / 60)} minutes...")
+    else:
         st.rerun()
 
+# Only tick while a quiz is pending; idle sessions have no timer at all
+if quiz_pending():
+    st.fragment(quiz_countdown, run_every=TIMER_TICK_SECONDS)()
+
 # ---------------- SIDEBAR ----------------
 st.sidebar.header("💬 Saved Chat History")
 
-if st.sidebar.button("Load saved chats"):
-    data = load_data()
-    if data["interactions"]:
-        for item in data["interactions"]:
-            st.sidebar.markdown(
-                f"**Q:** {item['query']}\n\n"
-                f"**A:** {item['response']}\n\n"
-                f"⏱ {item['time']}\n---"
-            )
-    else:
-        st.sidebar.info("No chat history yet!")
+if st.sidebar.toggle("Load saved chats"):
+    history_browser.render_history(DATA_FILE, "history_page", format_history_item, field="query")
 
 # ---------------- QUIZ FUNCTIONALITY ----------------
 st.sidebar.divider()
@@ -201,27 +246,19 @@ if st.session_state.quiz_question:
     if st.sidebar.button("Submit Answer"):
         if user_answer.strip():
             with st.spinner("Evaluating your answer..."):
-                evaluation_prompt = (
-                    "You are an examiner.\n\n"
-                    f"Topic: {st.session_state.quiz_topic}\n\n"
-                    f"Question: {st.session_state.quiz_question}\n\n"
-                    f"Student Answer: {user_answer}\n\n"
-                    "Decide whether the answer is correct or incorrect. "
-                    "Start your response with either 'Correct:' or 'Incorrect:' "
-                    "and then give a brief explanation."
-                )
-                
                 try:
-                    evaluation_response = client.models.generate_content(
-                        model=MODEL_NAME,
-                        contents=[
-                            types.Content(
-                                role="user",
-                                parts=[types.Part(text=evaluation_prompt)]
-                            )
-                        ]
+                    # Grade and line up the next question at the same time
+                    grade, st.session_state.upcoming_quiz = pipeline.run_all(
+                        grading.agrade_answer(
+                            client, MODEL_NAME, st.session_state.quiz_topic,
+                            st.session_state.quiz_question, user_answer
+                        ),
+                        pipeline.optional(get_quiz_pool(DATA_FILE).next_ready(aquiz_question))
+                    )
+                    st.session_state.evaluation_result = grade
+                    question_bank.get_bank(BANK_FILE).record_answer(
+                        st.session_state.quiz_question, user_answer, grade
                     )
-                    st.session_state.evaluation_result = evaluation_response.text
                     st.rerun()
                 except Exception as e:
                     st.sidebar.error(f"Evaluation error: {e}")
@@ -231,9 +268,12 @@ if st.session_state.quiz_question:
     # Display evaluation result
     if st.session_state.evaluation_result:
         st.sidebar.divider()
-        result_text = st.session_state.evaluation_result
-        if result_text.lower().startswith("correct"):
+        grade = st.session_state.evaluation_result
+        if grade["correct"]:
             st.sidebar.success("### ✅ Evaluation Result")
         else:
             st.sidebar.error("### ❌ Evaluation Result")
-        st.sidebar.markdown(st.session_state.evaluation_result)
\ No newline at end of file
+        st.sidebar.markdown(grading.format_grade(grade))
+
+# ---------------- DEBUG ----------------
+metrics.debug_panel()
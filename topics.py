@@ -0,0 +1,115 @@
+"""Keyword topic classifier, compiled once at import.
+
+All keywords go into one trie-shaped regex with word boundaries, so a
+message is scanned once and "ai" no longer matches inside "explain" (or
+"art" inside "start"). When several topics match, the one listed first in
+``TOPIC_KEYWORDS`` wins, as before.
+"""
+import re
+import sys
+
+import numpy as np
+
+import storage
+
+DEFAULT_TOPIC = "General"
+
+TOPIC_KEYWORDS = {
+    "Science": ["science", "physics", "chemistry", "biology", "experiment"],
+    "Technology": ["code", "programming", "computer", "ai", "software", "tech"],
+    "Math": ["math", "calculate", "equation", "number", "algebra"],
+    "History": ["history", "historical", "past", "ancient", "war"],
+    "Art": ["art", "painting", "music", "creative", "design"],
+    "Philosophy": ["philosophy", "meaning", "ethics", "existence"]
+}
+
+
+def _trie_pattern(words):
+    """Regex for a set of words shaped as a prefix trie, so each position fails fast"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return build(trie)
+
+
+def compile_keywords(topic_keywords):
+    """(pattern, word -> topic rank) for a keyword table, plain plurals included"""
+    ranks = {}
+    for rank, keywords in enumerate(topic_keywords.values()):
+        for keyword in keywords:
+            for word in (keyword, keyword + "s", keyword + "es"):
+                ranks.setdefault(word, rank)
+    return re.compile(rf"\b{_trie_pattern(ranks)}\b"), ranks
+
+
+_TOPICS = list(TOPIC_KEYWORDS)
+_PATTERN, _RANKS = compile_keywords(TOPIC_KEYWORDS)
+# classify_many's scanner: the keywords plus the newline between messages
+_SEPARATOR = -1
+_SCAN = re.compile(rf"\n|{_PATTERN.pattern}")
+_TOKEN_RANKS = dict(_RANKS, **{"\n": _SEPARATOR})
+
+
+def _topic(text_lower):
+    rank = min(map(_RANKS.__getitem__, _PATTERN.findall(text_lower)), default=None)
+    return DEFAULT_TOPIC if rank is None else _TOPICS[rank]
+
+
+def classify(text):
+    """The topic for one message"""
+    return _topic(text.lower())
+
+
+def classify_many(texts):
+    """
+    Topics for many messages in one regex pass over the newline-joined
+    text. The separators are matched too, so a running count of them maps
+    every keyword back to its message, and NumPy takes the best rank per
+    message.
+    """
+    texts = [text.replace("\n", " ") for text in texts]
+    if not texts:
+        return []
+    tokens = _SCAN.findall("\n".join(texts).lower())
+    ranks = np.fromiter(map(_TOKEN_RANKS.__getitem__, tokens), np.int64, len(tokens))
+    separators = ranks == _SEPARATOR
+    messages = np.cumsum(separators)
+    best = np.full(len(texts), len(_TOPICS))
+    np.minimum.at(best, messages[~separators], ranks[~separators])
+    topics = _TOPICS + [DEFAULT_TOPIC]
+    return [topics[rank] for rank in best.tolist()]
+
+
+def retag_history(path):
+    """
+    Re-classify every stored chat turn, e.g. after the keyword table
+    changed. The new topics are journaled as one batch of updates rather
+    than a rewrite, so turns appended meanwhile are kept; returns the
+    number of records retagged.
+    """
+    turns = [item for item in storage.load_data(path)["interactions"] if "query" in item]
+    updates = {
+        item["id"]: {"topic": topic}
+        for item, topic in zip(turns, classify_many([item["query"] for item in turns]))
+        if item.get("topic") != topic
+    }
+    storage.update_interactions(path, updates)
+    return len(updates)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "chat_history.json"
+    print(f"Retagged {retag_history(source)} interactions in {source}")
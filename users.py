@@ -0,0 +1,26 @@
+"""Which learner a Streamlit session belongs to."""
+import streamlit as st
+
+# Per-learner resources (quiz pools, due queues) kept in memory at once
+MAX_ACTIVE_USERS = 100
+
+
+def auth_configured():
+    """True when secrets.toml has an [auth] section for Streamlit sign-in"""
+    try:
+        return "auth" in st.secrets
+    except FileNotFoundError:  # No secrets file at all
+        return False
+
+
+def current_user_id():
+    """
+    The learner for this session: the signed-in account when Streamlit
+    authentication is configured, else ``?user=<name>`` in the URL. The URL
+    is ignored once sign-in exists, so nobody can open another learner's
+    files by editing it. Returns None for the shared single-user files.
+    """
+    if auth_configured():
+        # Signed-out visitors fall back to the shared files, never a learner's
+        return st.user.get("email") if st.user.get("is_logged_in") else None
+    return st.query_params.get("user") or None